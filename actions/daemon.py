@@ -1,43 +1,78 @@
 import os
-import sys
 import time
+import errno
+import fcntl
+import select
+import selectors
 import logging
 import daemon
 import daemon.pidfile
 import signal
-from datetime import datetime
+from typing import Optional, Tuple
 from config import Config
 from sync_strategies.factory import create_sync_strategy
 from .sync_utils import sync_history
+from .watch import HistoryWatcher, create_history_watcher
+
+# Как часто лог демона принудительно сбрасывается на диск
+LOG_SYNC_INTERVAL_SECONDS = 60
+
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
 
 def get_pid_file_path(config: Config) -> str:
     """Получает путь к PID файлу"""
     return os.path.expanduser(config.pid_file_path)
 
-def is_daemon_running(config: Config) -> bool:
-    """Проверяет, запущен ли демон"""
-    pid_file = get_pid_file_path(config)
-    if not os.path.exists(pid_file):
-        return False
-    
+def process_exists(pid: int) -> bool:
+    """Проверяет, существует ли процесс с таким PID"""
     try:
-        with open(pid_file, 'r') as f:
-            pid = int(f.read().strip())
-        
-        # Проверяем, существует ли процесс с таким PID
+        pidfd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return False
+    except (AttributeError, OSError):
+        # pidfd недоступен (не Linux или ядро старше 5.3)
         try:
             os.kill(pid, 0)
             return True
         except OSError:
             return False
-    except (ValueError, IOError):
+    os.close(pidfd)
+    return True
+
+def is_daemon_running(config: Config) -> bool:
+    """Проверяет, запущен ли демон"""
+    pid_file = get_pid_file_path(config)
+    try:
+        fd = os.open(pid_file, os.O_RDONLY)
+    except FileNotFoundError:
         return False
 
-def write_pid_file(config: Config):
-    """Writes process PID to file"""
+    # Работающий демон держит блокировку на PID файле; если ее удалось взять,
+    # файл остался от завершившегося процесса
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+def acquire_pid_file(config: Config) -> Optional[int]:
+    """Locks PID file and writes process PID to it.
+
+    Returns the descriptor that must stay open while the daemon runs,
+    or None if the file is locked by another running daemon.
+    """
     pid_file = get_pid_file_path(config)
-    with open(pid_file, 'w') as f:
-        f.write(str(os.getpid()))
+    fd = os.open(pid_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    return fd
 
 def remove_pid_file(config: Config):
     """Removes PID file"""
@@ -45,6 +80,89 @@ def remove_pid_file(config: Config):
     if os.path.exists(pid_file):
         os.remove(pid_file)
 
+def _poll_process_exit(pid: int, timeout: float) -> bool:
+    """Waits for process exit by polling its PID once per second"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process_exists(pid):
+            return True
+        time.sleep(1)
+    return False
+
+def wait_for_process_exit(pid: int, timeout: float = 10) -> bool:
+    """Waits for process exit, returns True if it exited within timeout"""
+    try:
+        pidfd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return True
+    except AttributeError:
+        pidfd = None
+    except OSError as e:
+        if e.errno not in (errno.ENOSYS, errno.EPERM):
+            raise
+        pidfd = None
+
+    if pidfd is not None:
+        # pidfd becomes readable as soon as the process terminates
+        try:
+            poller = select.poll()
+            poller.register(pidfd, select.POLLIN)
+            return bool(poller.poll(timeout * 1000))
+        finally:
+            os.close(pidfd)
+
+    if hasattr(select, 'kqueue'):
+        kq = select.kqueue()
+        try:
+            event = select.kevent(
+                pid,
+                filter=select.KQ_FILTER_PROC,
+                flags=select.KQ_EV_ADD | select.KQ_EV_ONESHOT,
+                fflags=select.KQ_NOTE_EXIT
+            )
+            try:
+                return bool(kq.control([event], 1, timeout))
+            except ProcessLookupError:
+                return True
+        finally:
+            kq.close()
+
+    return _poll_process_exit(pid, timeout)
+
+def create_wakeup_pipe() -> Tuple[int, int]:
+    """Creates a self-pipe the interpreter writes to when a signal arrives"""
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    os.set_blocking(write_fd, False)
+    signal.set_wakeup_fd(write_fd)
+    return read_fd, write_fd
+
+def wait_for_wakeup(read_fd: int, timeout: float, watcher: Optional[HistoryWatcher] = None) -> bool:
+    """Waits up to timeout for a signal on the self-pipe or a history file change.
+
+    Returns True if a signal arrived, False on timeout or history change.
+    """
+    deadline = time.monotonic() + timeout
+    with selectors.DefaultSelector() as selector:
+        selector.register(read_fd, selectors.EVENT_READ)
+        if watcher is not None:
+            selector.register(watcher, selectors.EVENT_READ)
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            ready = {key.fileobj for key, _ in selector.select(remaining)}
+            if read_fd in ready:
+                try:
+                    while os.read(read_fd, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+                return True
+            if watcher in ready and watcher.drain():
+                return False
+
 def stop_daemon(config: Config):
     """Stops the daemon"""
     pid_file = get_pid_file_path(config)
@@ -56,25 +174,20 @@ def stop_daemon(config: Config):
             if pid is not None:
                 try:
                     os.kill(pid, signal.SIGTERM)
-                    logging.info(f"Sent stop signal to process {pid}")
+                    logging.info("Sent stop signal to process %s", pid)
                     
                     # Wait for process to terminate
-                    for _ in range(10):
+                    if wait_for_process_exit(pid, timeout=10):
                         try:
-                            os.kill(pid, 0)
-                            time.sleep(1)
-                        except OSError:
-                            # Process terminated
-                            try:
-                                pidlock.break_lock()
-                            except Exception:
-                                pass
-                            logging.info("Daemon stopped successfully")
-                            return True
+                            pidlock.break_lock()
+                        except Exception:
+                            pass
+                        logging.info("Daemon stopped successfully")
+                        return True
                     logging.error("Failed to stop daemon")
                     return False
                 except OSError as e:
-                    logging.error(f"Error stopping daemon: {e}")
+                    logging.error("Error stopping daemon: %s", e)
                     try:
                         pidlock.break_lock()
                     except Exception:
@@ -84,7 +197,7 @@ def stop_daemon(config: Config):
             logging.error("Daemon is not running")
             return False
     except Exception as e:
-        logging.error(f"Error stopping daemon: {e}")
+        logging.error("Error stopping daemon: %s", e)
         return False
 
 def run_daemon(config: Config):
@@ -105,23 +218,34 @@ def run_daemon(config: Config):
     log_file = os.path.expanduser(config.log_file_path)
     log_fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
 
+    # Запись в лог идет через page cache, на диск он сбрасывается
+    # не чаще раза в LOG_SYNC_INTERVAL_SECONDS и при остановке
+    last_log_sync = time.monotonic()
+    # Метка времени форматируется заново не чаще раза в секунду
+    last_second = None
+    timestamp = b''
+
     def log_message(message):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        os.write(log_fd, f"{timestamp} - {message}\n".encode())
-        os.fsync(log_fd)  # Force write to disk
+        nonlocal last_log_sync, last_second, timestamp
+        second = int(time.time())
+        if second != last_second:
+            last_second = second
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second)).encode()
+        os.write(log_fd, timestamp + b' - ' + message.encode() + b'\n')
+        now = time.monotonic()
+        if now - last_log_sync >= LOG_SYNC_INTERVAL_SECONDS:
+            _fdatasync(log_fd)
+            last_log_sync = now
 
-    # Настраиваем обработчики сигналов
+    # Настраиваем обработчики сигналов. Сам обработчик ничего не делает:
+    # интерпретатор пишет номер сигнала в self-pipe, который ждет основной цикл
     def handle_sigterm(signo, frame):
-        log_message("Received SIGTERM, shutting down...")
-        os.close(log_fd)
-        remove_pid_file(config)
-        sys.exit(0)
+        pass
 
     # Создаем контекст демона
     context = daemon.DaemonContext(
         working_directory=os.path.expanduser('~'),
         umask=0o022,
-        pidfile=daemon.pidfile.PIDLockFile(pid_file),
         files_preserve=[log_fd],
         signal_map={
             signal.SIGTERM: handle_sigterm,
@@ -132,12 +256,25 @@ def run_daemon(config: Config):
     try:
         # Запускаем демон
         with context:
+            # PID файл блокируется до конца работы демона, так что проверка
+            # и захват файла выполняются одной операцией
+            pid_fd = acquire_pid_file(config)
+            if pid_fd is None:
+                log_message("Daemon is already running")
+                return False
             log_message("Daemon started")
-            write_pid_file(config)
+
+            # Pipe создается после демонизации, иначе DaemonContext закроет его
+            wakeup_r, wakeup_w = create_wakeup_pipe()
 
             # Создаем стратегию синхронизации
             strategy = create_sync_strategy(config)
 
+            # Опционально запускаем синхронизацию сразу после записи в историю
+            watcher = None
+            if config.watch_local_history:
+                watcher = create_history_watcher(config.local_history_path)
+
             # Основной цикл демона
             while True:
                 try:
@@ -147,12 +284,37 @@ def run_daemon(config: Config):
                 except Exception as e:
                     log_message(f"Unexpected error during sync: {str(e)}")
 
+                # Записи лога из буфера не должны ждать следующего цикла
+                for handler in logging.getLogger().handlers:
+                    handler.flush()
+
+                if watcher is not None:
+                    # Отбрасываем события от собственной записи файла истории
+                    watcher.drain()
+
                 log_message(f"Waiting {config.sync_interval_seconds} seconds...")
-                time.sleep(config.sync_interval_seconds)
+                if wait_for_wakeup(wakeup_r, config.sync_interval_seconds, watcher):
+                    break
+
+            log_message("Received SIGTERM, shutting down...")
+            signal.set_wakeup_fd(-1)
+            try:
+                strategy.close()
+            except Exception as e:
+                log_message(f"Error closing sync strategy: {str(e)}")
+            if watcher is not None:
+                watcher.close()
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+            _fdatasync(log_fd)
+            os.close(log_fd)
+            # Файл удаляется до снятия блокировки, чтобы не удалить PID нового демона
+            remove_pid_file(config)
+            os.close(pid_fd)
 
         return True
     except Exception as e:
-        logging.error(f"Error starting daemon: {e}")
+        logging.error("Error starting daemon: %s", e)
         import traceback
         traceback.print_exc()
         remove_pid_file(config)
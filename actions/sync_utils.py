@@ -1,11 +1,37 @@
 import os
+import re
+import sys
+import json
+import heapq
+import hashlib
 import logging
-from typing import List
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
 from config import Config
 from sync_strategies.base import HistorySyncStrategy
 
+# Строка расширенной истории zsh: ": <timestamp>:<duration>;<command>"
+_HISTORY_LINE_RE = re.compile(r'^: *(\d+)(?::\d*)?;(.*)$', re.MULTILINE)
+_HISTORY_LINE_BYTES_RE = re.compile(_HISTORY_LINE_RE.pattern.encode(), re.MULTILINE)
+# Разобранные команды интернируются через sys.intern: в истории zsh одни и те же
+# команды повторяются многократно, и повторы делят одну строку в памяти
+
+# Максимальное число буферов в одном вызове writev
+try:
+    _IOV_MAX = max(os.sysconf('SC_IOV_MAX'), 16)
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 1024
+
+# Разобранная локальная история по пути файла вместе с (mtime_ns, размер, inode):
+# пока файл не изменился, повторное чтение обходится без разбора
+_LOCAL_HISTORY_CACHE: Dict[str, Tuple[Tuple[int, int, int], Tuple[str, ...]]] = {}
+
+# fdatasync не сбрасывает метаданные inode; на macOS его нет
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
 @dataclass
 class Event:
     """Класс для представления события в истории"""
@@ -15,123 +41,195 @@ class Event:
     @classmethod
     def from_line(cls, line: str) -> 'Event':
         """Создает Event из строки истории"""
-        try:
-            # Split on first ': ' to handle cases where command contains ':'
-            parts = line.split(': ', 1)
-            if len(parts) != 2:
-                logging.debug(f"Skipping line - invalid format (no ': '): {line.strip()}")
-                return None
-                
-            # Split timestamp and command (format: "timestamp:0;command")
-            timestamp_cmd = parts[1].split(';', 1)
-            if len(timestamp_cmd) != 2:
-                logging.debug(f"Skipping line - invalid format (no ';'): {line.strip()}")
-                return None
-                
-            # Parse timestamp (format: "timestamp:0")
-            timestamp = timestamp_cmd[0].split(':')[0].strip()
-            if not timestamp.isdigit():
-                logging.debug(f"Skipping line - invalid timestamp: {line.strip()}")
-                return None
-                
-            command = timestamp_cmd[1].rstrip('\n')
-            return cls(int(timestamp), command)
-                
-        except (IndexError, ValueError) as e:
-            logging.debug(f"Skipping line - parsing error: {line.strip()}, error: {e}")
+        # Тот же разбор, что и в parse_history, чтобы формат проверялся в одном месте
+        match = _HISTORY_LINE_RE.match(line)
+        if match is None:
+            logging.debug("Skipping line - invalid format: %s", line.strip())
             return None
+        return cls(int(match.group(1)), sys.intern(match.group(2)))
 
     def to_line(self) -> str:
         """Преобразует Event в строку для записи в историю"""
         return f": {self.timestamp}:0;{self.command}\n"
 
+def parse_history(text: str) -> List[Tuple[int, str]]:
+    """Извлекает пары (timestamp, command) из текста истории за один проход"""
+    return [
+        (int(timestamp), sys.intern(command))
+        for timestamp, command in _HISTORY_LINE_RE.findall(text)
+    ]
+
+def parse_history_bytes(buffer) -> List[Tuple[int, str]]:
+    """Извлекает пары (timestamp, command) из байтового буфера истории (bytes, bytearray)"""
+    # Метафицированные команды zsh и случайные байты не в UTF-8 не должны
+    # срывать чтение всей истории: такие байты заменяются на U+FFFD
+    return [
+        (int(timestamp), sys.intern(command.decode('utf-8', 'replace')))
+        for timestamp, command in _HISTORY_LINE_BYTES_RE.findall(buffer)
+    ]
+
+def format_history(entries: List[Tuple[int, str]]) -> List[str]:
+    """Преобразует пары (timestamp, command) в строки истории"""
+    return [f": {timestamp}:0;{command}\n" for timestamp, command in entries]
+
 def read_local_history(file_path: str) -> List[str]:
     """Читает локальную историю из файла"""
     if not os.path.exists(file_path):
-        logging.warning(f"Local history file not found: {file_path}")
+        logging.warning("Local history file not found: %s", file_path)
         return []
         
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        with open(file_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            if not size:
+                logging.info("Local history file is empty")
+                return []
+            cache_path = os.path.abspath(file_path)
+            key = (st.st_mtime_ns, size, st.st_ino)
+            cached = _LOCAL_HISTORY_CACHE.get(cache_path)
+            if cached is not None and cached[0] == key:
+                logging.debug("Local history unchanged, using cached entries")
+                return list(cached[1])
+            # zsh may truncate or rewrite the file at any moment: a mapping would
+            # raise SIGBUS then, so the file is copied into memory in one read
+            data = f.read()
             
-        # Clean and validate entries
-        valid_entries = []
-        for i, line in enumerate(lines):
-            # Skip empty lines
-            if not line.strip():
-                logging.debug(f"Skipping empty line at index {i}")
-                continue
-                
-            try:
-                # Split on first ': ' to handle cases where command contains ':'
-                parts = line.split(': ', 1)
-                if len(parts) != 2:
-                    logging.debug(f"Skipping line {i} - invalid format (no ': '): {line.strip()}")
-                    continue
-                    
-                # Split timestamp and command
-                timestamp_cmd = parts[1].split(';', 1)
-                if len(timestamp_cmd) != 2:
-                    logging.debug(f"Skipping line {i} - invalid format (no ';'): {line.strip()}")
-                    continue
-                    
-                # Parse timestamp
-                timestamp = timestamp_cmd[0].split(':')[0].strip()
-                if not timestamp.isdigit():
-                    logging.debug(f"Skipping line {i} - invalid timestamp: {line.strip()}")
-                    continue
-                    
-                # Normalize the entry format
-                command = timestamp_cmd[1].rstrip('\n')
-                normalized_entry = f": {timestamp}:0;{command}\n"
-                valid_entries.append(normalized_entry)
-                logging.debug(f"Added valid entry at index {i}: {normalized_entry.strip()}")
-                
-            except (IndexError, ValueError) as e:
-                logging.debug(f"Skipping line {i} - parsing error: {line.strip()}, error: {e}")
-                continue
-                
-        logging.info(f"Read {len(lines)} total lines, found {len(valid_entries)} valid entries")
+        # Normalize entries, lines in other formats are skipped
+        valid_entries = format_history(parse_history_bytes(data))
+        _LOCAL_HISTORY_CACHE[cache_path] = (key, tuple(valid_entries))
+        logging.info("Read %d bytes, found %d valid entries", len(data), len(valid_entries))
         return valid_entries
         
     except Exception as e:
-        logging.error(f"Error reading local history: {e}")
+        logging.error("Error reading local history: %s", e)
         return []
 
+def _writev_all(fd: int, buffers: List[bytes]) -> None:
+    """Записывает буферы одним writev, дописывая остаток при частичной записи"""
+    written = os.writev(fd, buffers)
+    if written < sum(map(len, buffers)):
+        rest = b''.join(buffers)[written:]
+        while rest:
+            rest = rest[os.write(fd, rest):]
+
+def history_file_size(file_path: str) -> int:
+    """Возвращает размер файла истории, 0 если файла нет"""
+    try:
+        return os.stat(file_path).st_size
+    except FileNotFoundError:
+        return 0
+
+def read_local_history_tail(file_path: str, offset: int) -> List[str]:
+    """Читает записи, дописанные в файл истории после смещения offset"""
+    with open(file_path, 'rb') as f:
+        # Читаем с предыдущего байта, чтобы понять, начинается ли хвост с новой строки
+        f.seek(max(offset - 1, 0))
+        tail = f.read()
+    if offset:
+        # Незавершенную на момент первого чтения строку пропускаем
+        line_end = tail.find(b'\n')
+        if line_end < 0:
+            return []
+        tail = tail[line_end + 1:]
+    return format_history(parse_history_bytes(tail))
+
 def write_local_history(file_path: str, history: List[str]) -> None:
     """Записывает историю в локальный файл"""
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.writelines(history)
+    # Запись в пределах одного тика mtime не меняет ключ кэша
+    _LOCAL_HISTORY_CACHE.pop(os.path.abspath(file_path), None)
+    buffers = [line.encode('utf-8') for line in history]
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        for start in range(0, len(buffers), _IOV_MAX):
+            _writev_all(fd, buffers[start:start + _IOV_MAX])
+        _fdatasync(fd)
+    finally:
+        os.close(fd)
+
+def _history_digest(lines: List[str]) -> str:
+    """Хэш истории; строки нормализуются, чтобы он совпадал с хэшем записанного файла"""
+    digest = hashlib.blake2b(digest_size=8)
+    for line in lines:
+        digest.update(line.rstrip('\n').encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def local_history_digest(file_path: str) -> Optional[str]:
+    """Хэш содержимого локального файла истории, None если файла нет"""
+    try:
+        with open(file_path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return _history_digest([])
+            return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def load_sync_state(file_path: str) -> dict:
+    """Читает состояние предыдущей синхронизации"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.debug("Sync state is not used: %s", e)
+        return {}
+
+def save_sync_state(file_path: str, state: dict) -> None:
+    """Сохраняет состояние синхронизации"""
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, file_path)
+    except OSError as e:
+        logging.warning("Failed to save sync state: %s", e)
+
+def sorted_history_entries(history: List[str]) -> List[Tuple[int, str]]:
+    """Разбирает историю и сортирует ее по timestamp, если она еще не отсортирована"""
+    entries = parse_history('\n'.join(history))
+    if any(prev[0] > entry[0] for prev, entry in zip(entries, islice(entries, 1, None))):
+        entries.sort(key=itemgetter(0))
+    return entries
 
 def merge_histories(current_history: List[str], remote_history: List[str]) -> List[str]:
     """Объединяет две истории, удаляя дубликаты и сортируя по временным меткам"""
     # Логируем последние 5 строк из обеих историй
-    logging.debug("Last 5 lines from current history:")
-    for line in current_history[-5:]:
-        logging.debug(f"  {line.strip()}")
-        
-    logging.debug("Last 5 lines from remote history:")
-    for line in remote_history[-5:]:
-        logging.debug(f"  {line.strip()}")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Last 5 lines from current history:")
+        for line in current_history[-5:]:
+            logging.debug("  %s", line.strip())
+
+        logging.debug("Last 5 lines from remote history:")
+        for line in remote_history[-5:]:
+            logging.debug("  %s", line.strip())
         
-    # Конвертируем строки в события
-    events = []
-    for line in current_history + remote_history:
-        if not line.strip():
-            continue
-            
-        event = Event.from_line(line)
-        if event:
-            events.append(event)
+    # Файлы истории zsh дописываются в конец и уже отсортированы по времени,
+    # поэтому вместо сортировки объединения достаточно линейного слияния
+    merged_entries = heapq.merge(
+        sorted_history_entries(current_history),
+        sorted_history_entries(remote_history),
+        key=itemgetter(0)
+    )
     
-    # Удаляем дубликаты и сортируем по timestamp
-    unique_events = list({(e.timestamp, e.command): e for e in events}.values())
-    unique_events.sort(key=lambda e: e.timestamp)
+    # Удаляем дубликаты за тот же проход: одинаковые записи имеют одну метку
+    # времени и после слияния стоят рядом, поэтому помнить нужно только
+    # записи с текущей меткой, а не всю историю
+    seen = set()
+    current_timestamp = None
+    unique_entries = []
+    for entry in merged_entries:
+        if entry[0] != current_timestamp:
+            current_timestamp = entry[0]
+            seen.clear()
+        elif entry in seen:
+            continue
+        seen.add(entry)
+        unique_entries.append(entry)
     
     # Конвертируем обратно в строки
-    return [event.to_line() for event in unique_events]
+    return format_history(unique_entries)
 
 def sync_history(config: Config, strategy: HistorySyncStrategy):
     """Синхронизирует историю команд"""
@@ -140,31 +238,61 @@ def sync_history(config: Config, strategy: HistorySyncStrategy):
             # Читаем удаленную историю
             logging.info("Reading remote history")
             remote_history = strategy.read_remote_history()
-            logging.info(f"Read {len(remote_history)} lines from remote history")
+            logging.info("Read %d lines from remote history", len(remote_history))
+            
+            # Если обе истории не менялись с прошлой синхронизации, объединять нечего
+            remote_digest = _history_digest(remote_history)
+            state = load_sync_state(config.state_file_path)
+            if (state.get('remote') == remote_digest
+                    and state.get('local') == local_history_digest(config.local_history_path)):
+                logging.info("History unchanged since last synchronization, skipping")
+                return
             
             # Читаем локальную историю
             logging.info("Reading local history")
+            local_size = history_file_size(config.local_history_path)
             local_history = read_local_history(config.local_history_path)
-            logging.info(f"Read {len(local_history)} lines from local history")
+            logging.info("Read %d lines from local history", len(local_history))
             
             # Объединяем истории
             logging.info("Merging histories")
             merged_history = merge_histories(local_history, remote_history)
-            logging.info(f"Merged history contains {len(merged_history)} lines")
+            logging.info("Merged history contains %d lines", len(merged_history))
             
             # Записываем объединенную историю
             logging.info("Writing merged history to remote")
             strategy.write_remote_history(merged_history)
             logging.info("Remote history updated")
+            remote_digest = _history_digest(merged_history)
+            
+            # zsh дописывает историю в конец файла; подбираем команды,
+            # добавленные во время синхронизации, чтобы не затереть их
+            new_entries = []
+            if history_file_size(config.local_history_path) > local_size:
+                new_entries = read_local_history_tail(config.local_history_path, local_size)
+                if new_entries:
+                    logging.info("Found %d entries added during synchronization", len(new_entries))
+                    merged_history = merge_histories(merged_history, new_entries)
             
             # Записываем локальную историю
             logging.info("Writing merged history to local file")
             write_local_history(config.local_history_path, merged_history)
             logging.info("Local history updated")
             
+            # Запоминаем содержимое обеих историй после успешной синхронизации.
+            # Подобранные из хвоста команды еще не отправлены: состояние не
+            # сохраняется, и следующий цикл выполнит полное объединение
+            if new_entries:
+                logging.info("Entries added during synchronization will be pushed on the next cycle")
+            else:
+                save_sync_state(config.state_file_path, {
+                    'local': _history_digest(merged_history),
+                    'remote': remote_digest
+                })
+            
             logging.info("Synchronization completed")
         finally:
             strategy.cleanup()
     except Exception as e:
-        logging.error(f"Ошибка при синхронизации: {e}")
+        logging.error("Ошибка при синхронизации: %s", e)
         raise 
\ No newline at end of file
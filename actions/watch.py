@@ -0,0 +1,73 @@
+import os
+import sys
+import struct
+import ctypes
+import ctypes.util
+import logging
+from typing import Optional
+
+# Константы из <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+_EVENT_HEADER = struct.Struct('iIII')
+
+class HistoryWatcher:
+    """Следит через inotify за изменениями файла истории"""
+
+    def __init__(self, fd: int, file_name: bytes):
+        self.fd = fd
+        self.file_name = file_name
+
+    def fileno(self) -> int:
+        """Дескриптор inotify для регистрации в selectors"""
+        return self.fd
+
+    def drain(self) -> bool:
+        """Вычитывает накопленные события, возвращает True если менялся файл истории"""
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                if data[offset:offset + length].rstrip(b'\0') == self.file_name:
+                    changed = True
+                offset += length
+
+    def close(self):
+        """Закрывает дескриптор inotify"""
+        os.close(self.fd)
+
+def create_history_watcher(file_path: str) -> Optional[HistoryWatcher]:
+    """
+    Создает наблюдатель за файлом истории
+    Args:
+        file_path: путь к файлу истории
+    Returns:
+        HistoryWatcher: наблюдатель или None, если inotify недоступен
+    """
+    library = ctypes.util.find_library('c')
+    if not sys.platform.startswith('linux') or not library:
+        logging.warning("inotify is not available, history file changes are not watched")
+        return None
+
+    libc = ctypes.CDLL(library, use_errno=True)
+    fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+        logging.warning("inotify_init1 failed: %s", os.strerror(ctypes.get_errno()))
+        return None
+
+    # zsh может переписать файл через rename, поэтому следим за директорией
+    directory = os.path.dirname(file_path) or '.'
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        logging.warning("inotify_add_watch failed for %s: %s", directory, os.strerror(ctypes.get_errno()))
+        os.close(fd)
+        return None
+
+    return HistoryWatcher(fd, os.fsencode(os.path.basename(file_path)))
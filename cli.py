@@ -1,7 +1,22 @@
-import argparse
+import sys
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, List, Optional
 
-def create_parser() -> argparse.ArgumentParser:
+if TYPE_CHECKING:
+    import argparse
+
+# Флаги без значений, которые разбираются без argparse
+_FLAGS = {
+    '--once': 'once',
+    '--clear-remote': 'clear_remote',
+    '--stop': 'stop',
+    '--restart': 'restart'
+}
+
+def create_parser() -> 'argparse.ArgumentParser':
     """Создает парсер аргументов командной строки"""
+    import argparse
+
     parser = argparse.ArgumentParser(description='Синхронизатор истории команд zsh')
     
     parser.add_argument('--once', 
@@ -23,4 +38,24 @@ def create_parser() -> argparse.ArgumentParser:
     parser.add_argument('--config', 
                        help='Путь к конфигурационному файлу')
     
-    return parser 
\ No newline at end of file
+    return parser
+
+def parse_args(argv: Optional[List[str]] = None):
+    """
+    Разбирает аргументы командной строки
+    Args:
+        argv: аргументы без имени программы, по умолчанию sys.argv[1:]
+    Returns:
+        Namespace: разобранные аргументы
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Быстрый путь: без аргументов или с одним флагом argparse не нужен
+    if not argv or (len(argv) == 1 and argv[0] in _FLAGS):
+        args = SimpleNamespace(config=None, **{dest: False for dest in _FLAGS.values()})
+        if argv:
+            setattr(args, _FLAGS[argv[0]], True)
+        return args
+
+    return create_parser().parse_args(argv)
@@ -1,11 +1,42 @@
 import os
 import yaml
+import copy
 import logging
-from typing import Dict, Any, Optional
+import functools
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# LibYAML разбирает конфигурацию на C; без него остается медленный pure-Python загрузчик
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+    logger.warning("LibYAML is not available, falling back to the pure-Python YAML loader")
+
+# Разобранные конфигурации по (путь, mtime_ns, размер): повторный Config
+# для того же неизмененного файла обходится без чтения и разбора.
+# Каждый Config получает свою копию, изменения не видны другим экземплярам
+_PARSE_CACHE: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+
+@functools.lru_cache(maxsize=32)
+def _expand_path(path: str) -> str:
+    """Расширяет ~ до домашней директории, результат кэшируется"""
+    return os.path.expanduser(path)
+
+def _expand_optional_path(path: Optional[str]) -> Optional[str]:
+    """Расширяет путь, если он задан"""
+    return _expand_path(path) if path else path
 
 class Config:
     """Класс для работы с конфигурацией"""
 
+    __slots__ = (
+        'config_path', '_config', '_settings', '_git', '_ssh',
+        '_local_history', '_remote_history', '_git_repo', '_log_file',
+        '_pid_file', '_state_file', '_strategy_class'
+    )
+
     def __init__(self, config_path: str = 'config.yaml'):
         """
         Инициализация конфигурации
@@ -15,6 +46,30 @@ class Config:
         self.config_path = os.path.expanduser(config_path)
         self.config = self._load_config()
 
+    @property
+    def config(self) -> Dict[str, Any]:
+        """Словарь с конфигурацией"""
+        return self._config
+
+    @config.setter
+    def config(self, config: Dict[str, Any]):
+        """Заменяет конфигурацию и заново вычисляет пути из нее"""
+        self._config = config
+        # Класс стратегии синхронизации, определяется фабрикой стратегий
+        self._strategy_class = None
+        # Разделы конфигурации извлекаются один раз, а не при каждом обращении
+        self._settings = (config or {}).get('settings') or {}
+        self._git = (config or {}).get('git') or {}
+        self._ssh = (config or {}).get('ssh') or {}
+        # Пути разворачиваются один раз, свойства только возвращают готовые значения
+        paths = (config or {}).get('paths') or {}
+        self._local_history = _expand_optional_path(paths.get('local_history'))
+        self._remote_history = paths.get('remote_history')
+        self._git_repo = _expand_optional_path(paths.get('git_repo'))
+        self._log_file = _expand_optional_path(paths.get('log_file'))
+        self._pid_file = _expand_optional_path(paths.get('pid_file'))
+        self._state_file = _expand_path(paths.get('state_file', '~/.history_syncer/state.json'))
+
     def _load_config(self) -> Dict[str, Any]:
         """
         Загрузка конфигурации из файла
@@ -22,61 +77,93 @@ class Config:
             Dict: словарь с конфигурацией
         """
         try:
-            with open(self.config_path, 'r') as f:
-                config = yaml.safe_load(f)
-                logging.info(f"Используется конфигурационный файл: {self.config_path}")
-                return config
+            st = os.stat(self.config_path)
+            key = (os.path.abspath(self.config_path), st.st_mtime_ns, st.st_size)
+            config = _PARSE_CACHE.get(key)
+            if config is None:
+                # Файл читается целиком одним вызовом, UTF-8 декодирует сам LibYAML
+                with open(self.config_path, 'rb') as f:
+                    data = f.read()
+                config = yaml.load(data, Loader=_YamlLoader)
+                _PARSE_CACHE[key] = config
+            logger.info("Используется конфигурационный файл: %s", self.config_path)
+            return copy.deepcopy(config)
         except FileNotFoundError:
-            logging.error(f"Файл конфигурации не найден: {self.config_path}")
+            logger.error("Файл конфигурации не найден: %s", self.config_path)
             raise
         except yaml.YAMLError as e:
-            logging.error(f"Ошибка при чтении файла конфигурации: {e}")
+            logger.error("Ошибка при чтении файла конфигурации: %s", e)
             raise
 
+    @staticmethod
+    def invalidate_cache():
+        """Сбрасывает кэш разобранных конфигураций в памяти процесса"""
+        _PARSE_CACHE.clear()
+
     @property
     def sync_type(self) -> str:
         """Тип синхронизации (git/ssh)"""
-        return self.config.get('settings', {}).get('sync_type', 'git')
+        return self._settings.get('sync_type', 'git')
 
     @property
     def sync_interval_seconds(self) -> int:
         """Интервал синхронизации в секундах"""
         return self.config.get('sync_interval_seconds', 3600)
 
+    @property
+    def watch_local_history(self) -> bool:
+        """Запускать синхронизацию при изменении локального файла истории"""
+        return self._settings.get('watch_local_history', False)
+
     @property
     def local_history_path(self) -> str:
         """Путь к локальному файлу истории"""
-        return os.path.expanduser(self.config['paths']['local_history'])
+        return self._local_history
 
     @property
     def remote_history_path(self) -> str:
         """Путь к удаленному файлу истории"""
-        return self.config['paths']['remote_history']
+        return self._remote_history
 
     @property
     def git_repo_path(self) -> str:
         """Путь к локальному git репозиторию"""
-        return os.path.expanduser(self.config['paths']['git_repo'])
+        return self._git_repo
 
     @property
     def log_file_path(self) -> str:
         """Путь к файлу логов"""
-        return os.path.expanduser(self.config['paths']['log_file'])
+        return self._log_file
 
     @property
     def pid_file_path(self) -> str:
         """Путь к PID файлу"""
-        return os.path.expanduser(self.config['paths']['pid_file'])
+        return self._pid_file
+
+    @property
+    def state_file_path(self) -> str:
+        """Путь к файлу состояния синхронизации"""
+        return self._state_file
 
     @property
     def git_config(self) -> Dict[str, Any]:
         """Конфигурация для Git стратегии"""
-        return self.config.get('git', {})
+        return self._git
 
     @property
     def ssh_config(self) -> Dict[str, Any]:
         """Конфигурация для SSH стратегии"""
-        return self.config.get('ssh', {})
+        return self._ssh
+
+    @property
+    def strategy_class(self) -> Optional[type]:
+        """Класс стратегии синхронизации, выбранный фабрикой; None до первого выбора"""
+        return self._strategy_class
+
+    @strategy_class.setter
+    def strategy_class(self, strategy_class: Optional[type]):
+        """Запоминает класс стратегии до следующей замены конфигурации"""
+        self._strategy_class = strategy_class
 
     def get_git_param(self, param: str, default: Optional[Any] = None) -> Any:
         """
@@ -87,11 +174,7 @@ class Config:
         Returns:
             Any: значение параметра
         """
-        git_config = self.config.get('git', {})
-        value = git_config.get(param, default)
-        if value is None:
-            logging.error(f"Git parameter '{param}' not found in config")
-        return value
+        return self._git.get(param, default)
 
     def get_ssh_param(self, param: str, default: Optional[Any] = None) -> Any:
         """
@@ -102,7 +185,7 @@ class Config:
         Returns:
             Any: значение параметра
         """
-        return self.ssh_config.get(param, default)
+        return self._ssh.get(param, default)
 
     def get_path(self, path: str) -> str:
         """Получает путь и расширяет ~ до домашней директории"""
@@ -110,13 +193,12 @@ class Config:
             return path
             
         # Расширяем ~ до домашней директории
-        expanded_path = os.path.expanduser(path)
-        logging.info(f"Расширенный путь: {expanded_path}")
+        expanded_path = _expand_path(path)
+        logger.debug("Расширенный путь: %s", expanded_path)
         
         # Если путь относительный, делаем его абсолютным относительно git_repo
         if not os.path.isabs(expanded_path):
-            git_repo_path = os.path.expanduser(self.git_repo_path)
-            expanded_path = os.path.join(git_repo_path, expanded_path)
-            logging.info(f"Относительный путь преобразован в абсолютный: {expanded_path}")
+            expanded_path = os.path.join(self.git_repo_path, expanded_path)
+            logger.debug("Относительный путь преобразован в абсолютный: %s", expanded_path)
         
         return expanded_path 
\ No newline at end of file
@@ -2,55 +2,72 @@
 import os
 import sys
 import logging
-import argparse
+import logging.handlers
 from typing import Optional
 
 from actions import sync_once, clear_remote_history, stop_daemon, restart_daemon, run_daemon
 from config import Config
-from cli import create_parser
+from cli import parse_args
+
+# Сколько записей лога копится в памяти перед записью в файл
+LOG_BUFFER_CAPACITY = 16
+
+logger = logging.getLogger(__name__)
+
+# Форматтеры создаются один раз и переиспользуются всеми обработчиками
+FILE_FORMATTER = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+CONSOLE_FORMATTER = logging.Formatter('%(levelname)s: %(message)s')
 
 def setup_logging(config: Config):
     """Настройка логирования"""
-    log_dir = os.path.dirname(config.log_file_path)
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    os.makedirs(os.path.dirname(config.log_file_path), exist_ok=True)
     
     # Configure root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.DEBUG)
     
-    # Create formatters
-    file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_formatter = logging.Formatter('%(levelname)s: %(message)s')
+    # Повторный вызов заменяет обработчики, а не добавляет вторую копию
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+        target = getattr(handler, 'target', None)
+        handler.close()
+        if target is not None:
+            target.close()
     
     # Create handlers
-    file_handler = logging.FileHandler(config.log_file_path)
-    file_handler.setFormatter(file_formatter)
+    # FileHandler сбрасывает поток после каждой записи, поэтому записи копятся
+    # в небольшом MemoryHandler и пишутся пачкой; предупреждения, ошибки и
+    # конец каждого цикла синхронизации сбрасывают буфер
+    log_file_handler = logging.FileHandler(config.log_file_path)
+    log_file_handler.setFormatter(FILE_FORMATTER)
+    file_handler = logging.handlers.MemoryHandler(
+        LOG_BUFFER_CAPACITY,
+        flushLevel=logging.WARNING,
+        target=log_file_handler
+    )
     
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(console_formatter)
+    console_handler.setFormatter(CONSOLE_FORMATTER)
     
     # Add handlers to root logger
     root_logger.addHandler(file_handler)
     root_logger.addHandler(console_handler)
     
-    logging.info("Logging setup completed")
+    logger.info("Logging setup completed")
 
 def main(config_path: Optional[str] = None):
     """Основная функция"""
-    if config_path is None:
+    args = parse_args()
+
+    # Конфигурация загружается один раз, уже с учетом --config
+    if args.config:
+        config_path = args.config
+    elif config_path is None:
         config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yaml')
     
     config = Config(config_path)
     setup_logging(config)
 
-    parser = create_parser()
-    args = parser.parse_args()
-
-    if args.config:
-        config = Config(args.config)
-        setup_logging(config)
-
     if args.clear_remote:
         clear_remote_history(config)
     elif args.stop:
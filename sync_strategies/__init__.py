@@ -1,11 +1,28 @@
-from .base import HistorySyncStrategy
-from .git import GitHistorySyncStrategy
-from .memory import MemoryHistorySyncStrategy
-from .ssh import SSHHistorySyncStrategy
+import importlib
+
+# Модули стратегий импортируются при первом обращении (PEP 562): демону нужна
+# только настроенная стратегия, а git тянет за собой GitPython
+_LAZY = {
+    'HistorySyncStrategy': '.base',
+    'GitHistorySyncStrategy': '.git',
+    'MemoryHistorySyncStrategy': '.memory',
+    'SSHHistorySyncStrategy': '.ssh'
+}
 
 __all__ = [
     'HistorySyncStrategy',
     'GitHistorySyncStrategy',
     'MemoryHistorySyncStrategy',
     'SSHHistorySyncStrategy'
-] 
\ No newline at end of file
+]
+
+def __getattr__(name: str):
+    """Импортирует класс стратегии при первом обращении"""
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -26,5 +26,9 @@ class HistorySyncStrategy(ABC):
     
     @abstractmethod
     def cleanup(self):
-        """Очищает ресурсы стратегии"""
+        """Очищает ресурсы стратегии после цикла синхронизации"""
+        pass
+    
+    def close(self):
+        """Освобождает ресурсы, живущие между циклами; вызывается при остановке демона"""
         pass 
\ No newline at end of file
@@ -1,14 +1,21 @@
 from functools import wraps
 from typing import Callable, TypeVar
+import time
+import random
 import logging
 
 T = TypeVar('T')
 
-def retry(max_attempts: int = 3):
+def retry(max_attempts: int = 3, base_delay: float = 0.1, max_delay: float = 5.0):
     """Декоратор для повторных попыток выполнения операции
     
+    Между попытками выдерживается экспоненциально растущая пауза со случайным
+    разбросом, чтобы не повторять запрос к удаленной стороне сразу же.
+    
     Args:
         max_attempts (int): Максимальное количество попыток выполнения операции
+        base_delay (float): Пауза перед второй попыткой в секундах
+        max_delay (float): Максимальная пауза между попытками в секундах
         
     Returns:
         Callable: Декорированная функция с логикой повторных попыток
@@ -19,18 +26,21 @@ def retry(max_attempts: int = 3):
             # код функции
     """
     def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        # Логгер модуля декорируемой функции находится один раз при декорировании
+        logger = logging.getLogger(func.__module__)
+
         @wraps(func)
         def wrapper(*args, **kwargs) -> T:
-            attempt = 0
-            while attempt < max_attempts:
-                attempt += 1
+            for attempt in range(1, max_attempts + 1):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
                     if attempt == max_attempts:
-                        logging.warning(f"Не удалось выполнить операцию после {max_attempts} попыток: {e}")
+                        logger.warning("Не удалось выполнить операцию после %d попыток: %s", max_attempts, e)
                         raise
-                    logging.warning(f"Попытка {attempt}/{max_attempts} не удалась: {e}")
+                    logger.warning("Попытка %d/%d не удалась: %s", attempt, max_attempts, e)
+                    delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+                    time.sleep(delay * (0.5 + random.random() * 0.5))
             raise Exception(f"Достигнуто максимальное количество попыток ({max_attempts})")
         return wrapper
-    return decorator 
\ No newline at end of file
+    return decorator
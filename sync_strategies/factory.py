@@ -1,15 +1,16 @@
-from typing import Type, Dict
+import importlib
+from types import MappingProxyType
+from typing import Mapping
 from config import Config
 from .base import HistorySyncStrategy
-from .git import GitHistorySyncStrategy
-from .ssh import SSHHistorySyncStrategy
 import logging
 
-# Реестр доступных стратегий
-STRATEGIES: Dict[str, Type[HistorySyncStrategy]] = {
-    'git': GitHistorySyncStrategy,
-    'ssh': SSHHistorySyncStrategy
-}
+# Реестр доступных стратегий: имя класса в пакете sync_strategies. Модуль
+# стратегии импортируется, только когда она выбрана в конфигурации
+STRATEGIES: Mapping[str, str] = MappingProxyType({
+    'git': 'GitHistorySyncStrategy',
+    'ssh': 'SSHHistorySyncStrategy'
+})
 
 def create_sync_strategy(config: Config) -> HistorySyncStrategy:
     """
@@ -19,8 +20,13 @@ def create_sync_strategy(config: Config) -> HistorySyncStrategy:
     Returns:
         HistorySyncStrategy: стратегия синхронизации
     """
-    logging.info(f"Creating sync strategy with type: {config.sync_type}")
-    strategy_class = STRATEGIES.get(config.sync_type)
-    if not strategy_class:
-        raise ValueError(f"Неизвестный тип синхронизации: {config.sync_type}")
-    return strategy_class(config) 
\ No newline at end of file
+    # Класс стратегии определяется один раз для загруженной конфигурации
+    strategy_class = config.strategy_class
+    if strategy_class is None:
+        logging.info("Creating sync strategy with type: %s", config.sync_type)
+        class_name = STRATEGIES.get(config.sync_type)
+        if not class_name:
+            raise ValueError(f"Неизвестный тип синхронизации: {config.sync_type}")
+        strategy_class = getattr(importlib.import_module(__package__), class_name)
+        config.strategy_class = strategy_class
+    return strategy_class(config)
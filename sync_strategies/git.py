@@ -1,16 +1,44 @@
 import os
+import re
 import git
+import hashlib
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from .base import HistorySyncStrategy
 from .decorators import retry
 from config import Config
-from typing import List
+from typing import List, Optional
 from .git_utils import (
     setup_repository_directory,
     setup_git_remote,
-    setup_history_file
+    setup_history_file,
+    configure_fetch
 )
 
+# Buffer for history.txt reads and writes; the default 8 KiB means many small syscalls
+_IO_BUFFER_SIZE = 1 << 17
+
+# git push stderr when the remote branch moved since our last fetch
+_PUSH_REJECTED_RE = re.compile(r'\[rejected\]|non-fast-forward|fetch first')
+
+# Valid extended-history entry with its line ending, same format Event.from_line accepts
+_HISTORY_ENTRY_RE = re.compile(r'^: *\d+(?::\d*)?;.*(?:\n|\Z)', re.MULTILINE)
+
+# Line already in the form Event.to_line produces; it is kept as is
+_CANONICAL_LINE_RE = re.compile(r': (?:0|[1-9]\d*):0;[^\n]*\n')
+
+def _history_hasher(lines: List[str]):
+    """Создает blake2b хэш строк истории, который можно дополнять новыми строками"""
+    hasher = hashlib.blake2b(digest_size=16)
+    for line in lines:
+        hasher.update(line.encode('utf-8'))
+    return hasher
+
+def _git_blob_sha(data: bytes) -> str:
+    """SHA-1 of data as git stores it in a blob object"""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
 class GitHistorySyncStrategy(HistorySyncStrategy):
     """Git-based history synchronization implementation"""
     
@@ -21,142 +49,279 @@ class GitHistorySyncStrategy(HistorySyncStrategy):
         self.repo = None
         self.logger = logging.getLogger(__name__)
         self.history_file = os.path.join(self.git_repo_path, 'history.txt')
+        self.branch = config.get_git_param('branch', 'main')
+        # Only the synced branch is fetched, tags are never needed
+        self.fetch_refspec = f'+refs/heads/{self.branch}:refs/remotes/origin/{self.branch}'
+        self.remote_ref_path = f'refs/remotes/origin/{self.branch}'
+        # Состояние файла истории после последней записи: число строк, хэш и stat
+        self._saved_history = None
+        # SHA ветки на удаленном репозитории при последнем чтении и прочитанная история
+        self._last_remote_sha = None
+        self._last_remote_history = None
+        # Within this many seconds of the last check the remote is not contacted at all
+        self.fetch_cache_ttl = float(config.get_git_param('fetch_cache_ttl', 2.0))
+        self._last_fetch_time = None
+        # Хэш последней записанной истории и SHA origin/<branch> после этой записи
+        self._last_written = None
+        # Fetch started in the background during setup, consumed by the first read
+        self._prefetch = None
         
         self._setup_repository()
 
     def _setup_repository(self):
         """Setup Git repository and required files"""
         try:
-            self.logger.info(f"Setting up repository in {self.git_repo_path}")
+            self.logger.info("Setting up repository in %s", self.git_repo_path)
             self.repo = setup_repository_directory(self.git_repo_path, self.config)
             self.logger.info("Repository directory setup completed")
             
             self.logger.info("Setting up Git remote")
             setup_git_remote(self.repo, self.config)
+            configure_fetch(self.repo)
             self.logger.info("Git remote setup completed")
             
-            self.logger.info(f"Setting up history file at {self.history_file}")
+            self.logger.info("Setting up history file at %s", self.history_file)
             setup_history_file(self.repo, self.history_file, self.config)
             self.logger.info("History file setup completed")
+            
+            # Сетевой fetch идет в фоне до первого чтения. Он запускается только
+            # после setup_history_file: та может закоммитить и запушить файл, а
+            # fetch пишет объекты и remote refs; перед каждым push fetch дожидается
+            executor = ThreadPoolExecutor(max_workers=1)
+            self._prefetch = executor.submit(self.repo.git.fetch, '--no-tags', 'origin', self.fetch_refspec)
+            executor.shutdown(wait=False)
         except Exception as e:
-            self.logger.error(f"Error setting up repository: {e}")
+            self.logger.error("Error setting up repository: %s", e)
             raise
 
     def get_current_history(self) -> list:
         """Get current history from file"""
         from actions.sync_utils import read_local_history  # Перемещаем импорт сюда
         
-        self.logger.info(f"Reading current history from {self.config.local_history_path}")
+        self.logger.info("Reading current history from %s", self.config.local_history_path)
         history = read_local_history(self.config.local_history_path)
-        self.logger.info(f"Read {len(history)} lines from local history")
+        self.logger.info("Read %d lines from local history", len(history))
         return history
 
     def get_remote_history(self) -> list:
         """Get history from remote branch"""
         self.logger.info("Fetching remote history")
         try:
-            self.repo.git.fetch()
+            self.repo.git.fetch('--no-tags', 'origin', self.fetch_refspec)
             self.logger.info("Fetch completed")
             
-            remote_content = self.repo.git.show(f'origin/main:history.txt')
+            remote_content = self._read_remote_file()
             history = remote_content.splitlines(keepends=True)
-            self.logger.info(f"Read {len(history)} lines from remote history")
+            self.logger.info("Read %d lines from remote history", len(history))
             return history
         except git.exc.GitCommandError as e:
-            self.logger.error(f"Error fetching remote history: {e}")
+            self.logger.error("Error fetching remote history: %s", e)
             return []
 
+    def _head_blob_sha(self) -> Optional[str]:
+        """SHA of history.txt in HEAD, None if HEAD has no such file"""
+        try:
+            return (self.repo.head.commit.tree / 'history.txt').hexsha
+        except (KeyError, ValueError):
+            return None
+
+    def _remote_ref(self) -> git.RemoteReference:
+        """Remote-tracking ref of the synced branch, resolved by path without listing remote.refs"""
+        return git.RemoteReference(self.repo, self.remote_ref_path)
+
+    def _remote_sha(self) -> Optional[str]:
+        """Commit of origin/<branch> as last fetched or pushed; no network access"""
+        try:
+            return self._remote_ref().commit.hexsha
+        except ValueError:
+            return None
+
+    def _read_remote_file(self) -> str:
+        """Read history.txt from the remote-tracking branch in-process instead of git show"""
+        try:
+            tree = self._remote_ref().commit.tree
+            blob = tree / 'history.txt'
+        except (IndexError, KeyError, ValueError) as e:
+            raise git.exc.GitCommandError('show', f"history.txt not found in origin/{self.branch}: {e}")
+        return blob.data_stream.read().decode('utf-8')
+
+    def _wait_for_prefetch(self) -> bool:
+        """Wait for the background fetch started in setup; True if it succeeded"""
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is None:
+            return False
+        try:
+            prefetch.result()
+            return True
+        except Exception as e:
+            # Any failure, e.g. OSError when git cannot be spawned, only means
+            # the read fetches again; cleanup() relies on this never raising
+            self.logger.warning("Background fetch failed: %s", e)
+            return False
+
+    def _remote_head_sha(self) -> Optional[str]:
+        """SHA of the branch on origin via ls-remote: one round-trip, no object transfer"""
+        try:
+            output = self.repo.git.ls_remote('origin', f'refs/heads/{self.branch}')
+        except git.exc.GitCommandError as e:
+            self.logger.warning("ls-remote failed: %s", e)
+            return None
+        return output.split(None, 1)[0] if output else None
+
     def save_history(self, history: list):
         """Save history to file"""
         from actions.sync_utils import Event  # Перемещаем импорт сюда
         
-        self.logger.info(f"Saving {len(history)} lines to history file")
-        self.logger.debug(f"First 5 lines of input history: {[line.strip() for line in history[:5]]}")
+        self.logger.info("Saving %d lines to history file", len(history))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("First 5 lines of input history: %s", [line.strip() for line in history[:5]])
         
-        # Convert lines to Events and back to ensure proper formatting
+        # Only lines not already in canonical form go through Event and back
+        debug = self.logger.isEnabledFor(logging.DEBUG)
         formatted_history = []
         for i, line in enumerate(history):
+            if _CANONICAL_LINE_RE.fullmatch(line):
+                formatted_history.append(line)
+                continue
             if not line.strip():
-                self.logger.debug(f"Skipping empty line at index {i}")
+                if debug:
+                    self.logger.debug("Skipping empty line at index %s", i)
                 continue
                 
             event = Event.from_line(line)
             if event:
                 formatted_line = event.to_line()
                 formatted_history.append(formatted_line)
-                self.logger.debug(f"Formatted line {i}: {formatted_line.strip()}")
-            else:
-                self.logger.debug(f"Failed to parse line {i}: {line.strip()}")
+                if debug:
+                    self.logger.debug("Formatted line %s: %s", i, formatted_line.strip())
+            elif debug:
+                self.logger.debug("Failed to parse line %s: %s", i, line.strip())
         
-        self.logger.info(f"Formatted {len(formatted_history)} valid history entries")
-        self.logger.debug(f"First 5 lines of formatted history: {[line.strip() for line in formatted_history[:5]]}")
+        self.logger.info("Formatted %d valid history entries", len(formatted_history))
+        if debug:
+            self.logger.debug("First 5 lines of formatted history: %s", [line.strip() for line in formatted_history[:5]])
         
         # Ensure directory exists
         os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
         
         # Write to file
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                f.writelines(formatted_history)
-            self.logger.info(f"History saved to {self.history_file}")
+            appended = self._append_history(formatted_history)
+            if appended is None:
+                with open(self.history_file, 'w', encoding='utf-8', buffering=_IO_BUFFER_SIZE) as f:
+                    f.write(''.join(formatted_history))
+                self._remember_saved_history(len(formatted_history), _history_hasher(formatted_history))
+                self.logger.info("History saved to %s", self.history_file)
+            else:
+                self.logger.info("Appended %s lines to %s", appended, self.history_file)
             
-            # Verify file contents
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                saved_lines = f.readlines()
-            self.logger.info(f"Verified {len(saved_lines)} lines in saved file")
-            self.logger.debug(f"First 5 lines of saved file: {[line.strip() for line in saved_lines[:5]]}")
+            # Verify file contents; the extra full read is only worth it when debugging
+            if debug:
+                with open(self.history_file, 'r', encoding='utf-8', buffering=_IO_BUFFER_SIZE) as f:
+                    saved_lines = f.readlines()
+                self.logger.debug("Verified %d lines in saved file", len(saved_lines))
+                self.logger.debug("First 5 lines of saved file: %s", [line.strip() for line in saved_lines[:5]])
             
         except Exception as e:
-            self.logger.error(f"Error saving history to file: {e}")
+            self.logger.error("Error saving history to file: %s", e)
             raise
 
+    def _append_history(self, history: List[str]) -> Optional[int]:
+        """Дописывает в файл только новые строки, если начало истории совпадает с записанным
+        
+        Returns:
+            Optional[int]: число дописанных строк или None, если файл нужно переписать целиком
+        """
+        saved = self._saved_history
+        if saved is None or len(history) < saved['lines']:
+            return None
+        
+        # Файл мог измениться после нашей записи (pull, checkout)
+        try:
+            st = os.stat(self.history_file)
+        except FileNotFoundError:
+            return None
+        if (st.st_size, st.st_mtime_ns, st.st_ino) != saved['stat']:
+            return None
+        
+        hasher = _history_hasher(history[:saved['lines']])
+        if hasher.digest() != saved['digest']:
+            return None
+        
+        new_lines = history[saved['lines']:]
+        with open(self.history_file, 'a', encoding='utf-8', buffering=_IO_BUFFER_SIZE) as f:
+            f.write(''.join(new_lines))
+        for line in new_lines:
+            hasher.update(line.encode('utf-8'))
+        self._remember_saved_history(len(history), hasher)
+        return len(new_lines)
+
+    def _remember_saved_history(self, lines: int, hasher):
+        """Запоминает состояние файла истории после записи"""
+        st = os.stat(self.history_file)
+        self._saved_history = {
+            'lines': lines,
+            'digest': hasher.digest(),
+            'stat': (st.st_size, st.st_mtime_ns, st.st_ino)
+        }
+
     @retry(max_attempts=3)
     def read_remote_history(self) -> List[str]:
         """Read history from remote Git repository"""
-        from actions.sync_utils import Event  # Добавляем импорт сюда
-        
         self.logger.info("Starting remote history read")
         
         try:
-            # Fetch remote changes
-            self.logger.info("Fetching remote changes")
-            fetch_info = self.repo.remotes.origin.fetch()
-            if not fetch_info:
-                raise git.exc.GitCommandError("fetch", "Failed to fetch remote changes")
-            self.logger.info("Fetch completed")
+            # Remote was checked moments ago and nothing was pushed since
+            if (self._last_fetch_time is not None
+                    and time.monotonic() - self._last_fetch_time < self.fetch_cache_ttl):
+                self.logger.info("Remote checked %.2fs ago, using cached remote history",
+                                 time.monotonic() - self._last_fetch_time)
+                return list(self._last_remote_history)
+            
+            # Remote branch has not moved since the last read: skip fetch and parsing.
+            # Without a cached read there is nothing to compare with, and the
+            # ls-remote round trip would only precede the fetch
+            if self._last_remote_sha is not None:
+                remote_sha = self._remote_head_sha()
+                if remote_sha is not None and remote_sha == self._last_remote_sha:
+                    self.logger.info("Remote branch unchanged, using cached remote history")
+                    self._last_fetch_time = time.monotonic()
+                    return list(self._last_remote_history)
+            
+            # Fetch remote changes unless the background fetch already did
+            if self._wait_for_prefetch():
+                self.logger.info("Using background fetch")
+            else:
+                self.logger.info("Fetching remote changes")
+                fetch_info = self.repo.remotes.origin.fetch(refspec=self.fetch_refspec, no_tags=True)
+                if not fetch_info:
+                    raise git.exc.GitCommandError("fetch", "Failed to fetch remote changes")
+                self.logger.info("Fetch completed")
             
             # Get remote history
             try:
                 self.logger.info("Reading remote history file")
                 try:
-                    remote_content = self.repo.git.show('origin/main:history.txt')
+                    remote_content = self._read_remote_file()
                     if not remote_content:
                         self.logger.warning("Remote history file is empty")
                         return []
-                    self.logger.debug(f"Raw remote content: {remote_content}")
+                    self.logger.debug("Raw remote content: %s", remote_content)
                 except git.exc.GitCommandError as e:
-                    self.logger.error(f"Failed to show remote file: {e}")
+                    self.logger.error("Failed to show remote file: %s", e)
                     return []
                     
-                remote_history = remote_content.splitlines(keepends=True)
-                if not remote_history:
-                    self.logger.warning("No history entries found in remote file")
-                    return []
-                    
-                self.logger.info(f"Read {len(remote_history)} lines from remote history")
-                if remote_history:
-                    self.logger.debug(f"First 5 lines from remote: {[line.strip() for line in remote_history[:5]]}")
+                # Valid entries are picked out of the file in one regex pass instead
+                # of splitting it into lines and parsing every line through Event
+                valid_entries = _HISTORY_ENTRY_RE.findall(remote_content)
+                self.logger.info("Read %d valid entries from remote history", len(valid_entries))
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("First 5 lines from remote: %s", [line.strip() for line in valid_entries[:5]])
                 
-                # Verify history entries format
-                valid_entries = []
-                for i, line in enumerate(remote_history):
-                    if not line.strip():
-                        continue
-                    event = Event.from_line(line)
-                    if event:
-                        valid_entries.append(line)
-                    else:
-                        self.logger.warning(f"Invalid history entry at line {i}: {line.strip()}")
+                # Fewer entries than lines: report what was skipped, line by line
+                line_count = remote_content.count('\n') + (not remote_content.endswith('\n'))
+                if len(valid_entries) < line_count:
+                    self._report_invalid_entries(remote_content)
                 
                 if not valid_entries:
                     self.logger.warning("No valid history entries found in remote file")
@@ -164,84 +329,115 @@ class GitHistorySyncStrategy(HistorySyncStrategy):
                 
                 self.logger.info("Saving remote history locally")
                 self.save_history(valid_entries)
+                self._last_remote_sha = self._remote_ref().commit.hexsha
+                self._last_remote_history = list(valid_entries)
+                self._last_fetch_time = time.monotonic()
                 return valid_entries
             except git.exc.GitCommandError as e:
-                self.logger.error(f"Error reading remote history file: {e}")
+                self.logger.error("Error reading remote history file: %s", e)
                 return []
 
         except Exception as e:
-            self.logger.error(f"Error reading remote history: {e}")
+            self.logger.error("Error reading remote history: %s", e)
             return []
 
+    def _report_invalid_entries(self, content: str) -> None:
+        """Log every non-empty line of the remote file that is not a history entry"""
+        for i, line in enumerate(content.split('\n')):
+            if line.strip() and not _HISTORY_ENTRY_RE.match(line):
+                self.logger.warning("Invalid history entry at line %s: %s", i, line.strip())
+
     @retry(max_attempts=3)
     def write_remote_history(self, history: List[str]) -> None:
         """Write history to remote Git repository"""
-        self.logger.info(f"Starting remote history write with {len(history)} lines")
+        self.logger.info("Starting remote history write with %d lines", len(history))
+        
+        # Same history as the last write and the remote branch has not moved since
+        digest = _history_hasher(history).digest()
+        if self._last_written is not None and self._last_written == (digest, self._remote_sha()):
+            self.logger.debug("History unchanged since the last write, skipping")
+            return
         
         try:
-            # Pull latest changes first
-            self.logger.info("Pulling latest changes")
-            try:
-                pull_result = self.repo.remotes.origin.pull()
-                if not pull_result:
-                    raise git.exc.GitCommandError("pull", "Failed to pull changes")
-                self.logger.info("Pull completed successfully")
-            except git.exc.GitCommandError:
-                self.logger.warning("Regular pull failed, trying with --allow-unrelated-histories")
-                pull_result = self.repo.git.pull('--allow-unrelated-histories')
-                if not pull_result:
-                    raise git.exc.GitCommandError("pull", "Failed to pull changes with --allow-unrelated-histories")
-                self.logger.info("Pull with --allow-unrelated-histories completed")
-            
-            # Save history locally
-            self.logger.info("Saving history locally")
-            self.logger.debug(f"First 5 lines of history to save: {[line.strip() for line in history[:5]]}")
-            self.save_history(history)
-            
-            # Verify local file exists and has content
-            if not os.path.exists(self.history_file):
-                raise FileNotFoundError(f"History file not found after save: {self.history_file}")
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                saved_content = f.read()
-            if not saved_content:
-                raise ValueError("History file is empty after save")
-            
-            # Add and commit changes
-            self.logger.info("Adding and committing changes")
-            self.repo.index.add(['history.txt'])
-            if not self.repo.index.diff('HEAD'):
-                self.logger.warning("No changes to commit")
-                return
-                
-            commit = self.repo.index.commit("Update history")
-            if not commit:
-                raise git.exc.GitCommandError("commit", "Failed to commit changes")
-            self.logger.info("Changes committed")
-            
-            # Push changes
-            self.logger.info("Pushing changes to remote")
-            push_info = self.repo.git.push('origin', 'main')
-            if not push_info:
-                raise git.exc.GitCommandError("push", "Failed to push changes")
-            self.logger.info("Changes pushed successfully")
-            
-            # Verify remote history
+            # read_remote_history has just fetched origin/<branch> and the history
+            # already contains it, so the commit goes on top of it without a pull;
+            # if someone pushed in between, the push is rejected and retried once
             try:
-                remote_content = self.repo.git.show('origin/main:history.txt')
-                if not remote_content:
-                    raise ValueError("Remote history file is empty after push")
-                self.logger.info("Remote history verified")
+                self._commit_and_push(history)
             except git.exc.GitCommandError as e:
-                raise git.exc.GitCommandError("verify", f"Failed to verify remote history: {e}")
+                if not _PUSH_REJECTED_RE.search(f"{e.stdout}{e.stderr}"):
+                    raise
+                self.logger.warning("Push rejected, merging remote changes and retrying")
+                from actions.sync_utils import merge_histories
+                self.repo.remotes.origin.fetch(refspec=self.fetch_refspec, no_tags=True)
+                history = merge_histories(history, self._read_remote_file().splitlines(keepends=True))
+                digest = _history_hasher(history).digest()
+                self._commit_and_push(history)
+            self._last_written = (digest, self._remote_sha())
             
         except Exception as e:
-            self.logger.error(f"Error writing history: {e}")
+            self.logger.error("Error writing history: %s", e)
             raise
 
+    def _commit_and_push(self, history: List[str]) -> None:
+        """Commit history on top of origin/<branch> and push it"""
+        self._wait_for_prefetch()
+        # Move the branch to the fetched remote commit; the working tree is
+        # left alone because history.txt is rewritten right below
+        remote_sha = self._remote_sha()
+        if remote_sha is not None and self.repo.head.commit.hexsha != remote_sha:
+            self.repo.head.reset(remote_sha, index=True, working_tree=False)
+        
+        # Save history locally
+        self.logger.info("Saving history locally")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("First 5 lines of history to save: %s", [line.strip() for line in history[:5]])
+        self.save_history(history)
+        
+        # Verify local file exists and has content
+        if not os.path.exists(self.history_file):
+            raise FileNotFoundError(f"History file not found after save: {self.history_file}")
+        with open(self.history_file, 'rb') as f:
+            saved_content = f.read()
+        if not saved_content:
+            raise ValueError("History file is empty after save")
+        
+        # Identical content hashes to the blob already in HEAD: skip hashing
+        # the file again in index.add and the diff against HEAD
+        if self._head_blob_sha() == _git_blob_sha(saved_content):
+            self.logger.warning("No changes to commit")
+            return
+        
+        # Add and commit changes
+        self.logger.info("Adding and committing changes")
+        # The remote is about to change, cached reads are no longer valid
+        self._last_fetch_time = None
+        self.repo.index.add(['history.txt'])
+        if not self.repo.index.diff('HEAD'):
+            self.logger.warning("No changes to commit")
+            return
+            
+        commit = self.repo.index.commit("Update history")
+        if not commit:
+            raise git.exc.GitCommandError("commit", "Failed to commit changes")
+        self.logger.info("Changes committed")
+        
+        # Push changes
+        self.logger.info("Pushing changes to remote")
+        # --porcelain reports the pushed refs on stdout; plain push prints only to stderr
+        push_info = self.repo.git.push('--porcelain', 'origin', self.branch)
+        # The porcelain line for our ref confirms the update; no read-back of the file
+        if f"refs/heads/{self.branch}" not in push_info:
+            raise git.exc.GitCommandError("push", "Failed to push changes")
+        self.logger.info("Changes pushed successfully")
+
     @retry(max_attempts=3)
     def clear_remote_history(self):
         """Clear remote history"""
         self.logger.info("Starting remote history clear")
+        self._wait_for_prefetch()
+        self._last_written = None
+        self._last_fetch_time = None
         try:
             # Clear local history
             self.logger.info("Clearing local history")
@@ -271,55 +467,45 @@ class GitHistorySyncStrategy(HistorySyncStrategy):
                 self.repo.git.push('--force', 'origin', self.config.get_git_param('branch', 'main'))
                 self.logger.info("Force push completed")
             except git.exc.GitCommandError as e:
-                self.logger.error(f"Failed to force push: {e}")
+                self.logger.error("Failed to force push: %s", e)
                 return False
             
             # Verify remote history is cleared
             try:
-                remote_content = self.repo.git.show('origin/main:history.txt')
+                remote_content = self._read_remote_file()
                 if remote_content:
                     raise ValueError("Remote history file is not empty after clear")
                 self.logger.info("Remote history verified as cleared")
             except git.exc.GitCommandError as e:
-                self.logger.error(f"Failed to verify remote history: {e}")
+                self.logger.error("Failed to verify remote history: %s", e)
                 return False
             
             self.logger.info("History cleared successfully")
             return True
             
         except Exception as e:
-            self.logger.error(f"Error clearing remote history: {e}")
+            self.logger.error("Error clearing remote history: %s", e)
             return False
 
     def cleanup(self):
         """Cleanup resources"""
         self.logger.info("Cleaning up resources")
+        self._wait_for_prefetch()
         if hasattr(self, 'repo'):
             self.repo.close()
             self.logger.info("Repository closed")
 
     def merge_histories(self, local_history: List[str], remote_history: List[str]) -> List[str]:
-        """Merge local and remote histories, sorting by timestamp"""
-        from actions.sync_utils import Event  # Добавляем импорт сюда
+        """Merge local and remote histories, sorting by timestamp and removing duplicates"""
+        from actions.sync_utils import merge_histories  # Добавляем импорт сюда
         
         self.logger.info("Starting history merge")
-        self.logger.debug(f"Local history: {len(local_history)} entries")
-        self.logger.debug(f"Remote history: {len(remote_history)} entries")
-        
-        # Convert all entries to Event objects
-        events = []
-        for line in local_history + remote_history:
-            if not line.strip():
-                continue
-            event = Event.from_line(line)
-            if event:
-                events.append(event)
-        
-        # Sort by timestamp
-        events.sort(key=lambda x: x.timestamp)
+        self.logger.debug("Local history: %d entries", len(local_history))
+        self.logger.debug("Remote history: %d entries", len(remote_history))
         
-        # Convert back to lines
-        merged_history = [event.to_line() for event in events]
+        # The shared merge does the linear heap merge of both ordered histories
+        # and drops entries present in both, as the sync loop expects
+        merged_history = merge_histories(local_history, remote_history)
         
-        self.logger.info(f"Merged history contains {len(merged_history)} entries")
-        return merged_history 
\ No newline at end of file
+        self.logger.info("Merged history contains %d entries", len(merged_history))
+        return merged_history
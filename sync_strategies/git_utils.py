@@ -1,16 +1,20 @@
 import os
+import re
 import git
 import shutil
 from typing import Optional
 from config import Config
 import logging
 
+# Ответ сервера на клонирование несуществующего репозитория
+_REPOSITORY_NOT_FOUND_RE = re.compile(r'repository not found', re.IGNORECASE)
+
 def setup_repository_directory(git_repo_path: str, config: Config) -> Optional[git.Repo]:
     """Setup repository directory and clone if needed"""
     expanded_path = os.path.expanduser(git_repo_path)
-    logging.info(f"Setting up repository directory at {git_repo_path}")
-    logging.info(f"Expanded path: {expanded_path}")
-    logging.info(f"Directory exists: {os.path.exists(expanded_path)}")
+    logging.info("Setting up repository directory at %s", git_repo_path)
+    logging.info("Expanded path: %s", expanded_path)
+    logging.info("Directory exists: %s", os.path.exists(expanded_path))
     if os.path.exists(expanded_path):
         return handle_existing_directory(expanded_path, config)
     else:
@@ -21,17 +25,33 @@ def handle_existing_directory(git_repo_path: str, config: Config) -> Optional[gi
     if not os.path.exists(os.path.join(git_repo_path, '.git')):
         clean_directory(git_repo_path)
         return clone_repository(git_repo_path, config)
-    else:
-        return git.Repo(git_repo_path)
+
+    # Re-clone only when the repository cannot be opened at all;
+    # a leftover state from an interrupted sync is repaired in place
+    try:
+        repo = git.Repo(git_repo_path)
+    except git.exc.InvalidGitRepositoryError as e:
+        logging.warning("Repository at %s is broken, cloning again: %s", git_repo_path, e)
+        clean_directory(git_repo_path)
+        return clone_repository(git_repo_path, config)
+    recover_repository(repo)
+    return repo
+
+def recover_repository(repo: git.Repo):
+    """Abort a merge left unfinished by an interrupted pull"""
+    if os.path.exists(os.path.join(repo.git_dir, 'MERGE_HEAD')):
+        logging.warning("Aborting unfinished merge in sync repository")
+        repo.git.merge('--abort')
 
 def clean_directory(git_repo_path: str):
     """Clean directory contents"""
-    for item in os.listdir(git_repo_path):
-        item_path = os.path.join(git_repo_path, item)
-        if os.path.isfile(item_path):
-            os.unlink(item_path)
-        elif os.path.isdir(item_path):
-            shutil.rmtree(item_path)
+    # scandir returns the entry type from the directory listing, without a stat per entry
+    with os.scandir(git_repo_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
 
 def create_and_clone_directory(git_repo_path: str, config: Config) -> Optional[git.Repo]:
     """Create directory and clone repository"""
@@ -40,17 +60,23 @@ def create_and_clone_directory(git_repo_path: str, config: Config) -> Optional[g
 
 def clone_repository(git_repo_path: str, config: Config) -> Optional[git.Repo]:
     """Clone repository from remote or create new one if remote doesn't exist"""
+    repository_url = config.get_git_param('repository_url')
+    if repository_url is None:
+        logging.error("Git parameter 'repository_url' not found in config")
     try:
+        # Only the synced branch is needed: skip other branches and tags
         return git.Repo.clone_from(
-            config.get_git_param('repository_url'),
+            repository_url,
             git_repo_path,
-            branch=config.get_git_param('branch', 'main')
+            branch=config.get_git_param('branch', 'main'),
+            single_branch=True,
+            no_tags=True
         )
     except git.exc.GitCommandError as e:
-        if "Repository not found" in str(e):
+        if _REPOSITORY_NOT_FOUND_RE.search(e.stderr or str(e)):
             # Create new repository
             repo = git.Repo.init(git_repo_path)
-            repo.create_remote('origin', config.get_git_param('repository_url'))
+            repo.create_remote('origin', repository_url)
             return repo
         raise
 
@@ -62,6 +88,34 @@ def setup_git_remote(repo: git.Repo, config: Config):
     if repo.active_branch.name != config.get_git_param('branch', 'main'):
         repo.git.checkout(config.get_git_param('branch', 'main'))
 
+# Настройки git для быстрого fetch: skipping-согласование шлет меньше "have"-строк,
+# commit-graph ускоряет обход истории при согласовании и слиянии
+FETCH_SETTINGS = (
+    ('fetch', 'negotiationAlgorithm', 'skipping'),
+    ('fetch', 'writeCommitGraph', 'true'),
+    ('core', 'commitGraph', 'true'),
+    ('core', 'multiPackIndex', 'true'),
+    ('gc', 'writeCommitGraph', 'true'),
+)
+
+def configure_fetch(repo: git.Repo):
+    """Configure fetch negotiation and commit-graph for a single-branch sync repository"""
+    with repo.config_reader() as reader:
+        missing = [(section, option, value) for section, option, value in FETCH_SETTINGS
+                   if not (reader.has_option(section, option)
+                           and str(reader.get_value(section, option)).lower() == value.lower())]
+    if missing:
+        with repo.config_writer() as writer:
+            for section, option, value in missing:
+                writer.set_value(section, option, value)
+    
+    # Commit-graph пишется один раз; дальше его обновляет fetch.writeCommitGraph
+    if not os.path.exists(os.path.join(repo.git_dir, 'objects', 'info', 'commit-graph')):
+        try:
+            repo.git.commit_graph('write', '--reachable')
+        except git.exc.GitCommandError as e:
+            logging.warning("Failed to write commit-graph: %s", e)
+
 def setup_history_file(repo: git.Repo, history_file: str, config: Config):
     """Setup history file if it doesn't exist"""
     if not os.path.exists(history_file):
@@ -23,4 +23,4 @@ class MemoryHistorySyncStrategy(HistorySyncStrategy):
 
     def cleanup(self):
         """Очищает ресурсы стратегии"""
-        pass 
\ No newline at end of file
+        pass
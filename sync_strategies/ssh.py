@@ -1,14 +1,37 @@
 #!/usr/bin/env python3
 import os
+import re
 import time
 import logging
 import subprocess
 import tempfile
-from typing import List, Optional
+from typing import Iterable, List, Optional, Union
 from .base import HistorySyncStrategy
 from .decorators import retry
 from config import Config
 
+# fdatasync не сбрасывает метаданные inode; на macOS его нет
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+# Буфер записи файлов: строки пишутся по одной, без склейки всего файла в памяти
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Сокет общего SSH-соединения по умолчанию; %C - хэш хоста, порта и пользователя
+DEFAULT_CONTROL_PATH = '~/.ssh/zsh_sync-%C'
+# Сколько живет общее соединение после последней команды
+CONTROL_PERSIST = '60s'
+
+# Код выхода удаленного скрипта очистки, если файл блокировки уже существует
+LOCKED_EXIT_CODE = 2
+
+# Пауза между проверками файла блокировки: от 50 мс, растет в 1.5 раза до 2 с
+LOCK_POLL_INITIAL_DELAY = 0.05
+LOCK_POLL_MAX_DELAY = 2.0
+
+# Сообщения ssh/scp в stderr, по которым различаются ошибки
+_PERMISSION_DENIED_RE = re.compile(r'permission denied', re.IGNORECASE)
+_NO_SUCH_FILE_RE = re.compile(r'no such file', re.IGNORECASE)
+
 class SSHHistorySyncStrategy(HistorySyncStrategy):
     """Реализация синхронизации через SSH"""
     
@@ -24,65 +47,102 @@ class SSHHistorySyncStrategy(HistorySyncStrategy):
             self.ssh_connection = (
                 f"{self.config.get_ssh_param('username')}@{self.config.get_ssh_param('host')}"
             )
-            logging.info(f"SSH соединение настроено: {self.ssh_connection}")
+            # Все вызовы ssh и scp идут через одно мультиплексированное соединение:
+            # первый вызов становится мастером, остальные не проходят заново TCP и аутентификацию
+            self.control_path = os.path.expanduser(
+                self.config.get_ssh_param('control_path', DEFAULT_CONTROL_PATH)
+            )
+            # Каталог для сокета создается при первом подключении, а не в конструкторе
+            self._control_dir_ready = False
+            logging.info("SSH соединение настроено: %s", self.ssh_connection)
         except Exception as e:
-            logging.error(f"Ошибка при установке SSH соединения: {e}")
+            logging.error("Ошибка при установке SSH соединения: %s", e)
             raise
     
     def _setup_lock_file(self):
         """Настраивает файл блокировки"""
         self.lock_file = self.config.get_ssh_param('lock_file', 'zsh_sync_lock.lock')
-        logging.info(f"Файл блокировки: {self.lock_file}")
+        logging.info("Файл блокировки: %s", self.lock_file)
     
+    def _ssh_options(self) -> List[str]:
+        """Общие опции ssh и scp: неинтерактивный режим и мультиплексирование соединения"""
+        if not self._control_dir_ready:
+            try:
+                os.makedirs(os.path.dirname(self.control_path), mode=0o700, exist_ok=True)
+            except OSError as e:
+                logging.warning("Не удалось создать каталог для сокета SSH: %s", e)
+            self._control_dir_ready = True
+        return [
+            '-o', 'BatchMode=yes',
+            '-o', 'ConnectTimeout=5',
+            '-o', 'ControlMaster=auto',
+            '-o', f'ControlPath={self.control_path}',
+            '-o', f'ControlPersist={CONTROL_PERSIST}'
+        ]
+
+    def _close_master_connection(self):
+        """Закрывает общее SSH-соединение"""
+        subprocess.run(
+            ['ssh', '-o', f'ControlPath={self.control_path}', '-O', 'exit', self.ssh_connection],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+
     def _check_lock_file(self) -> bool:
         """Проверяет наличие файла блокировки"""
         try:
             result = subprocess.run(
-                ['ssh', self.ssh_connection, f'test -f {self.lock_file}'],
+                ['ssh', *self._ssh_options(), self.ssh_connection, f'test -f {self.lock_file}'],
                 capture_output=True,
                 text=True
             )
             return result.returncode == 0
         except Exception as e:
-            logging.error(f"Ошибка при проверке файла блокировки: {e}")
+            logging.error("Ошибка при проверке файла блокировки: %s", e)
             return False
     
     def _create_lock_file(self):
         """Создает файл блокировки"""
         try:
             subprocess.run(
-                ['ssh', self.ssh_connection, f'touch {self.lock_file}'],
+                ['ssh', *self._ssh_options(), self.ssh_connection, f'touch {self.lock_file}'],
                 check=True,
                 capture_output=True,
                 text=True
             )
             logging.info("Файл блокировки создан")
         except Exception as e:
-            logging.error(f"Ошибка при создании файла блокировки: {e}")
+            logging.error("Ошибка при создании файла блокировки: %s", e)
             raise
     
     def _remove_lock_file(self):
         """Удаляет файл блокировки"""
         try:
             subprocess.run(
-                ['ssh', self.ssh_connection, f'rm -f {self.lock_file}'],
+                ['ssh', *self._ssh_options(), self.ssh_connection, f'rm -f {self.lock_file}'],
                 check=True,
                 capture_output=True,
                 text=True
             )
             logging.info("Файл блокировки удален")
         except Exception as e:
-            logging.error(f"Ошибка при удалении файла блокировки: {e}")
+            logging.error("Ошибка при удалении файла блокировки: %s", e)
             raise
     
     def _wait_for_lock_with_timeout(self, timeout: int = 5) -> bool:
         """Ожидает освобождения файла блокировки с таймаутом"""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
+        # Каждая проверка - обращение по сети, поэтому пауза между ними растет
+        deadline = time.monotonic() + timeout
+        delay = LOCK_POLL_INITIAL_DELAY
+        while True:
             if not self._check_lock_file():
                 return True
-            time.sleep(0.1)
-        return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(LOCK_POLL_MAX_DELAY, delay * 1.5)
     
     def _wait_for_lock(self):
         """Ожидает освобождения файла блокировки"""
@@ -91,13 +151,7 @@ class SSHHistorySyncStrategy(HistorySyncStrategy):
     
     def _run_ssh_command(self, command: str, timeout: int = 10) -> str:
         """Выполняет SSH команду и возвращает результат"""
-        ssh_command = [
-            'ssh',
-            '-o', 'BatchMode=yes',
-            '-o', 'ConnectTimeout=5',
-            f"{self.config.get_ssh_param('username')}@{self.config.get_ssh_param('host')}",
-            command
-        ]
+        ssh_command = ['ssh', *self._ssh_options(), self.ssh_connection, command]
         
         try:
             result = subprocess.run(
@@ -109,13 +163,13 @@ class SSHHistorySyncStrategy(HistorySyncStrategy):
             )
             return result.stdout
         except subprocess.TimeoutExpired as e:
-            logging.error(f"SSH команда превысила таймаут {timeout} секунд: {e}")
+            logging.error("SSH команда превысила таймаут %s секунд: %s", timeout, e)
             raise
         except subprocess.CalledProcessError as e:
-            logging.error(f"SSH команда завершилась с ошибкой: {e}")
+            logging.error("SSH команда завершилась с ошибкой: %s", e)
             raise
         except Exception as e:
-            logging.error(f"Ошибка при выполнении SSH команды: {e}")
+            logging.error("Ошибка при выполнении SSH команды: %s", e)
             raise
 
     def read_remote_history(self) -> List[str]:
@@ -124,104 +178,88 @@ class SSHHistorySyncStrategy(HistorySyncStrategy):
             output = self._run_ssh_command(f"cat {self.config.remote_history_path}")
             return output.splitlines()
         except subprocess.CalledProcessError as e:
-            if "Permission denied" in str(e.stderr):
+            stderr = e.stderr or ''
+            if _PERMISSION_DENIED_RE.search(stderr):
                 logging.error("Отказано в доступе к удаленному файлу истории")
                 raise
-            elif "No such file" in str(e.stderr):
+            elif _NO_SUCH_FILE_RE.search(stderr):
                 logging.warning("Удаленный файл истории не существует")
                 return []
             else:
-                logging.error(f"Ошибка при чтении удаленной истории: {e}")
+                logging.error("Ошибка при чтении удаленной истории: %s", e)
                 raise
         except Exception as e:
-            logging.error(f"Ошибка при чтении удаленной истории: {e}")
+            logging.error("Ошибка при чтении удаленной истории: %s", e)
             raise
 
     def write_remote_history(self, history: List[str]) -> None:
         """Записывает историю на удаленный хост через SSH"""
         try:
-            # Создаем временный файл с историей
-            with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
-                temp_file.write('\n'.join(history))
-                temp_file.flush()
-                
-                # Создаем родительскую директорию на удаленном хосте
-                remote_dir = os.path.dirname(self.config.remote_history_path)
-                mkdir_command = [
-                    'ssh',
-                    '-o', 'BatchMode=yes',
-                    '-o', 'ConnectTimeout=5',
-                    f"{self.config.get_ssh_param('username')}@{self.config.get_ssh_param('host')}",
-                    f"mkdir -p {remote_dir}"
-                ]
-                subprocess.run(mkdir_command, capture_output=True, text=True, check=True)
-                
-                # Копируем файл на удаленный хост
-                scp_command = [
-                    'scp',
-                    '-o', 'BatchMode=yes',
-                    '-o', 'ConnectTimeout=5',
-                    temp_file.name,
-                    f"{self.config.get_ssh_param('username')}@{self.config.get_ssh_param('host')}:{self.config.remote_history_path}"
-                ]
-                
-                subprocess.run(scp_command, capture_output=True, text=True, check=True)
-                
-            os.unlink(temp_file.name)
+            # История передается через stdin одной командой ssh: без временного
+            # файла и отдельных вызовов mkdir и scp; mv на удаленном хосте атомарен
+            data = b''.join(
+                (line if line.endswith('\n') else line + '\n').encode('utf-8', 'surrogateescape')
+                for line in history
+            )
+            remote_path = self.config.remote_history_path
+            remote_dir = os.path.dirname(remote_path)
+            command = f"cat > {remote_path}.tmp && mv {remote_path}.tmp {remote_path}"
+            if remote_dir:
+                command = f"mkdir -p {remote_dir} && {command}"
+            subprocess.run(
+                ['ssh', *self._ssh_options(), self.ssh_connection, command],
+                input=data,
+                capture_output=True,
+                check=True
+            )
         except subprocess.CalledProcessError as e:
-            if "Permission denied" in str(e.stderr):
+            if _PERMISSION_DENIED_RE.search((e.stderr or b'').decode('utf-8', 'replace')):
                 logging.error("Отказано в доступе при записи удаленной истории")
             else:
-                logging.error(f"Ошибка при записи удаленной истории: {e}")
+                logging.error("Ошибка при записи удаленной истории: %s", e)
             raise
         except Exception as e:
-            logging.error(f"Ошибка при записи удаленной истории: {e}")
+            logging.error("Ошибка при записи удаленной истории: %s", e)
             raise
 
     @retry(max_attempts=3)
     def clear_remote_history(self):
         """Очищает удаленную историю"""
         try:
-            # Проверяем наличие файла блокировки
-            if self._check_lock_file():
+            # Проверка блокировки, ее захват, очистка и снятие выполняются одним
+            # скриптом за одно соединение; код 2 означает, что файл уже заблокирован
+            script = (
+                f'if [ -e {self.lock_file} ]; then exit {LOCKED_EXIT_CODE}; fi; '
+                f"trap 'rm -f {self.lock_file}' EXIT; "
+                f'touch {self.lock_file} && : > {self.config.remote_history_path}'
+            )
+            result = subprocess.run(
+                ['ssh', *self._ssh_options(), self.ssh_connection, script],
+                capture_output=True,
+                text=True
+            )
+
+            if result.returncode == LOCKED_EXIT_CODE:
                 logging.warning("Обнаружен файл блокировки, ожидаем...")
                 return False
-
-            # Создаем файл блокировки
-            self._create_lock_file()
-            logging.info("Файл блокировки создан")
-
-            try:
-                # Очищаем историю
-                result = subprocess.run(
-                    ['ssh', self.ssh_connection, f'truncate -s 0 {self.config.remote_history_path}'],
-                    capture_output=True,
-                    text=True,
-                    check=True  # Это вызовет исключение при ненулевом коде возврата
-                )
-                
-                logging.info("Удаленная история очищена")
-                return True
-
-            except subprocess.CalledProcessError as e:
-                logging.error(f"Ошибка при очистке удаленной истории: {e.stderr}")
+            if result.returncode != 0:
+                logging.error("Ошибка при очистке удаленной истории: %s", result.stderr)
                 return False
-            finally:
-                # Удаляем файл блокировки
-                self._remove_lock_file()
-                logging.info("Файл блокировки удален")
+
+            logging.info("Удаленная история очищена")
+            return True
 
         except Exception as e:
-            logging.error(f"Ошибка при очистке удаленной истории: {e}")
+            logging.error("Ошибка при очистке удаленной истории: %s", e)
             return False
     
     def merge_histories(self, current_history: List[str], remote_history: List[str]) -> List[str]:
         """Объединяет локальную и удаленную историю"""
-        # Объединяем истории и удаляем дубликаты
-        merged = list(set(current_history + remote_history))
-        # Сортируем по времени (если есть временные метки)
-        merged.sort()
-        return merged
+        from actions.sync_utils import merge_histories
+        
+        # Общее слияние разбирает строки заново, поэтому концы строк не важны,
+        # а дубликаты удаляются с обеих сторон
+        return merge_histories(current_history, remote_history)
     
     def cleanup(self):
         """Очищает ресурсы стратегии"""
@@ -229,40 +267,65 @@ class SSHHistorySyncStrategy(HistorySyncStrategy):
             if hasattr(self, '_remove_lock_file'):
                 self._remove_lock_file()
         except Exception as e:
-            logging.error(f"Ошибка при очистке ресурсов SSH стратегии: {e}")
+            logging.error("Ошибка при очистке ресурсов SSH стратегии: %s", e)
+    
+    def close(self):
+        """Закрывает общее SSH-соединение при остановке демона"""
+        # Между циклами соединение переиспользуется, ControlPersist закроет его и без нас
+        if not self._control_dir_ready:
+            return
+        try:
+            self._close_master_connection()
+        except Exception as e:
+            logging.error("Ошибка при закрытии SSH соединения: %s", e)
 
     def _read_file_with_fallback(self, file_path: str) -> List[str]:
         """Читает файл с использованием различных кодировок"""
         encodings = ['utf-8', 'latin-1', 'cp1252']
         content = []
         
+        try:
+            with open(file_path, 'rb') as f:
+                raw_content = f.read()
+        except Exception as e:
+            logging.error("Ошибка при чтении файла %s: %s", file_path, e)
+            return content
+        
         for encoding in encodings:
             try:
-                with open(file_path, 'rb') as f:
-                    raw_content = f.read()
                 content = raw_content.decode(encoding).splitlines(keepends=True)
                 break
             except UnicodeDecodeError:
                 continue
-            except Exception as e:
-                logging.error(f"Ошибка при чтении файла {file_path}: {e}")
-                break
         
         return content
 
-    def _write_file_safely(self, file_path: str, content: List[str]):
+    def _write_file_safely(self, file_path: str, content: Iterable[Union[bytes, str]]):
         """Безопасно записывает файл с использованием временного файла"""
+        temp_path = None
         try:
-            # Создаем временный файл
-            with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
-                temp_file.write(''.join(content))
+            # Временный файл создается рядом с целевым, иначе os.replace
+            # не сработает между разными файловыми системами
+            with tempfile.NamedTemporaryFile(
+                mode='wb',
+                buffering=_WRITE_BUFFER_SIZE,
+                dir=os.path.dirname(os.path.abspath(file_path)),
+                delete=False
+            ) as temp_file:
                 temp_path = temp_file.name
+                temp_file.writelines(
+                    chunk if isinstance(chunk, bytes) else chunk.encode('utf-8', 'surrogateescape')
+                    for chunk in content
+                )
+                if self.config.get_ssh_param('durable_writes', False):
+                    temp_file.flush()
+                    _fdatasync(temp_file.fileno())
 
             # Перемещаем временный файл на место целевого
             os.replace(temp_path, file_path)
-            logging.info(f"Файл {file_path} успешно записан")
+            logging.info("Файл %s успешно записан", file_path)
         except Exception as e:
-            logging.error(f"Ошибка при записи файла {file_path}: {e}")
-            if os.path.exists(temp_path):
+            logging.error("Ошибка при записи файла %s: %s", file_path, e)
+            if temp_path and os.path.exists(temp_path):
                 os.remove(temp_path)
-            raise 
\ No newline at end of file
+            raise
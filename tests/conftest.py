@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import git
+import pytest
+from io import BytesIO
+from gitdb import IStream
+from git.objects.fun import tree_to_stream
+from config import Config
+from tests.helpers import format_history_entry_bytes
+
+# Git subprocesses in tests never prompt for credentials and skip the optional
+# index locks taken by read-only commands: every test owns its repositories
+os.environ.setdefault('GIT_TERMINAL_PROMPT', '0')
+os.environ.setdefault('GIT_OPTIONAL_LOCKS', '0')
+
+@pytest.fixture(scope="session")
+def git_template(tmp_path_factory):
+    """Bare repository with the initial history, built once per test session"""
+    remote_dir = tmp_path_factory.mktemp('git-template') / 'remote.git'
+    bare_repo = git.Repo.init(remote_dir, bare=True)
+    
+    # The initial commit is written straight into the object database:
+    # no working clone, no index and no push
+    data = format_history_entry_bytes("remote_command1", 1000) + format_history_entry_bytes("remote_command2", 2000)
+    blob = bare_repo.odb.store(IStream(git.Blob.type, len(data), BytesIO(data)))
+    tree_data = BytesIO()
+    tree_to_stream([(blob.binsha, 0o100644, 'history.txt')], tree_data.write)
+    tree = bare_repo.odb.store(IStream(git.Tree.type, tree_data.tell(), BytesIO(tree_data.getvalue())))
+    commit = git.Commit.create_from_tree(bare_repo, git.Tree(bare_repo, tree.binsha), "Initial commit", head=False)
+    bare_repo.head.reference = git.Head.create(bare_repo, 'main', commit)
+    bare_repo.close()
+    
+    # Sample hooks from git's init template are most of the files in a fresh
+    # repository; dropping them keeps the per-test copy to a handful of files
+    shutil.rmtree(remote_dir / 'hooks', ignore_errors=True)
+    return remote_dir
+
+@pytest.fixture
+def setup_git_repo(git_template, tmp_path):
+    """Setup test Git repository: a private copy of the template remote per test"""
+    remote_dir = str(tmp_path / 'remote.git')
+    local_repo_dir = str(tmp_path / 'repo')
+    local_history = tmp_path / 'local_history.txt'
+    local_history_path = str(local_history)
+    
+    # Copying the small bare repository is much cheaper than init + commit + push
+    shutil.copytree(git_template, remote_dir)
+    os.makedirs(local_repo_dir)
+    
+    # Create local history
+    local_history.write_bytes(
+        format_history_entry_bytes("local_command1", 3000) + format_history_entry_bytes("local_command2", 4000)
+    )
+    
+    # Create config
+    config = Config()
+    config.config = {
+        'sync_type': 'git',
+        'paths': {
+            'local_history': local_history_path,
+            'remote_history': os.path.join(local_repo_dir, 'history.txt'),
+            'git_repo': local_repo_dir,
+            'log_file': os.path.join(local_repo_dir, 'history_syncer.log'),
+            'pid_file': os.path.join(local_repo_dir, 'history_syncer.pid')
+        },
+        'git': {
+            'repository_url': remote_dir,
+            'branch': 'main'
+        }
+    }
+    
+    return config, remote_dir, local_repo_dir, local_history_path
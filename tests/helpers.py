@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+import re
+from typing import List, Tuple
+
+def format_history_entry(command: str, timestamp: int) -> str:
+    """Форматирует команду в формат zsh истории с явной меткой времени"""
+    return f": {timestamp}:0;{command}\n"
+
+def format_history_entry_bytes(command: str, timestamp: int) -> bytes:
+    """То же, что format_history_entry, но сразу в байтах, как историю передают по ssh"""
+    return format_history_entry(command, timestamp).encode('utf-8')
+
+# Строка истории zsh: ": <timestamp>:<duration>;<command>"
+HISTORY_RE = re.compile(r'^: *(\d+):\d*;(.*)$', re.M)
+
+def parse_history(lines: List[str]) -> Tuple[List[int], List[str]]:
+    """Разбирает историю одним проходом регулярного выражения: (метки времени, команды)"""
+    matches = HISTORY_RE.findall(''.join(line if line.endswith('\n') else line + '\n' for line in lines))
+    return [int(timestamp) for timestamp, _ in matches], [command for _, command in matches]
+
+def ts_of(line: str) -> int:
+    """Метка времени одной строки истории"""
+    return int(HISTORY_RE.match(line).group(1))
+
+def cmd_of(line: str) -> str:
+    """Команда одной строки истории"""
+    return HISTORY_RE.match(line).group(2)
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+import pytest
+from cli import create_parser, parse_args
+
+@pytest.mark.parametrize('argv', [
+    [],
+    ['--once'],
+    ['--clear-remote'],
+    ['--stop'],
+    ['--restart'],
+    ['--once', '--config', 'config.yaml'],
+    ['--config=config.yaml']
+])
+def test_parse_args(argv):
+    """Тест совпадения быстрого разбора аргументов с argparse"""
+    assert vars(parse_args(argv)) == vars(create_parser().parse_args(argv))
+
+def test_parse_unknown_args():
+    """Тест ошибки на неизвестном аргументе"""
+    with pytest.raises(SystemExit):
+        parse_args(['--unknown'])
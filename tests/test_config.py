@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import os
+import pytest
+import yaml
+from config import Config
+
+CONFIG_TEMPLATE = """
+paths:
+  local_history: {local_history}
+  remote_history: history.txt
+  git_repo: ~/.zsh_history_git
+  log_file: ~/.history_syncer/history_syncer.log
+  pid_file: ~/.history_syncer/history_syncer.pid
+
+settings:
+  sync_type: {sync_type}
+"""
+
+@pytest.fixture
+def config_path(tmp_path):
+    """Фикстура для файла конфигурации"""
+    path = os.path.join(tmp_path, 'config.yaml')
+    write_config(path, sync_type='git')
+    return path
+
+def write_config(path: str, sync_type: str, local_history: str = '~/.zsh_history'):
+    """Записывает файл конфигурации"""
+    with open(path, 'w') as f:
+        f.write(CONFIG_TEMPLATE.format(sync_type=sync_type, local_history=local_history))
+
+def test_load_config(config_path):
+    """Тест загрузки конфигурации"""
+    config = Config(config_path)
+    assert config.sync_type == 'git'
+    assert config.local_history_path == os.path.expanduser('~/.zsh_history')
+    assert config.remote_history_path == 'history.txt'
+
+def test_config_cache(config_path, monkeypatch):
+    """Тест кэша разобранной конфигурации в памяти процесса"""
+    first = Config(config_path)
+    assert not os.path.exists(config_path + '.cache')
+
+    # Неизмененный файл не разбирается повторно
+    def fail_load(*args, **kwargs):
+        raise AssertionError("unchanged config must not be parsed again")
+    monkeypatch.setattr(yaml, 'load', fail_load)
+    second = Config(config_path)
+    monkeypatch.undo()
+
+    # Каждый экземпляр получает свою копию конфигурации
+    assert second.config == first.config
+    second.config['settings']['sync_type'] = 'ssh'
+    assert Config(config_path).config['settings']['sync_type'] == 'git'
+
+    # Изменение файла конфигурации делает кэш недействительным
+    write_config(config_path, sync_type='ssh')
+    stat = os.stat(config_path)
+    os.utime(config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert Config(config_path).sync_type == 'ssh'
+
+def test_missing_config(tmp_path):
+    """Тест отсутствующего файла конфигурации"""
+    with pytest.raises(FileNotFoundError):
+        Config(os.path.join(tmp_path, 'missing.yaml'))
+
+def test_strategy_class_cache(config_path):
+    """Тест: класс стратегии определяется заново при замене конфигурации"""
+    from sync_strategies import GitHistorySyncStrategy
+
+    config = Config(config_path)
+    config.strategy_class = GitHistorySyncStrategy
+    assert config.strategy_class is GitHistorySyncStrategy
+    config.config = dict(config.config, settings={'sync_type': 'ssh'})
+    assert config.strategy_class is None
+    assert config.sync_type == 'ssh'
+
+def test_strategy_registry():
+    """Тест: все стратегии реестра разрешаются в классы стратегий"""
+    import sync_strategies
+    from sync_strategies.factory import STRATEGIES
+
+    for class_name in STRATEGIES.values():
+        assert issubclass(getattr(sync_strategies, class_name), sync_strategies.HistorySyncStrategy)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import os
+import time
+import signal
+import subprocess
+import pytest
+from config import Config
+from actions.daemon import (
+    process_exists, wait_for_process_exit, create_wakeup_pipe, wait_for_wakeup,
+    is_daemon_running, acquire_pid_file
+)
+from actions.watch import create_history_watcher
+
+@pytest.fixture
+def sleeping_process():
+    """Фикстура для дочернего процесса, который ждет сигнала"""
+    process = subprocess.Popen(['sleep', '30'])
+    yield process
+    process.kill()
+    process.wait()
+
+@pytest.fixture
+def pid_config(tmp_path):
+    """Фикстура для конфигурации с PID файлом во временной директории"""
+    config = Config()
+    config.config = {'paths': {'pid_file': str(tmp_path / 'history_syncer.pid')}}
+    return config
+
+def test_process_exists(sleeping_process):
+    """Тест проверки существования процесса"""
+    assert process_exists(sleeping_process.pid)
+    sleeping_process.kill()
+    sleeping_process.wait()
+    assert not process_exists(sleeping_process.pid)
+
+def test_wait_for_process_exit(sleeping_process):
+    """Тест ожидания завершения процесса после SIGTERM"""
+    sleeping_process.send_signal(signal.SIGTERM)
+    assert wait_for_process_exit(sleeping_process.pid, timeout=5)
+
+def test_wait_for_process_exit_timeout(sleeping_process):
+    """Тест таймаута ожидания работающего процесса"""
+    assert not wait_for_process_exit(sleeping_process.pid, timeout=0.1)
+
+def test_wait_for_wakeup():
+    """Тест пробуждения по сигналу через self-pipe"""
+    previous_handler = signal.signal(signal.SIGUSR1, lambda signo, frame: None)
+    read_fd, write_fd = create_wakeup_pipe()
+    try:
+        assert not wait_for_wakeup(read_fd, 0.01)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert wait_for_wakeup(read_fd, 1)
+        # Pipe вычитан полностью, повторного пробуждения нет
+        assert not wait_for_wakeup(read_fd, 0.01)
+    finally:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGUSR1, previous_handler)
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def test_wait_for_history_change(tmp_path):
+    """Тест пробуждения при записи в файл истории"""
+    history_file = tmp_path / '.zsh_history'
+    watcher = create_history_watcher(str(history_file))
+    if watcher is None:
+        pytest.skip("inotify is not available")
+    read_fd, write_fd = os.pipe()
+    try:
+        # Запись в другие файлы директории не будит демона
+        (tmp_path / 'other').write_text('data')
+        assert not watcher.drain()
+
+        history_file.write_text(': 1000:0;ls\n')
+        started = time.monotonic()
+        assert not wait_for_wakeup(read_fd, 5, watcher)
+        assert time.monotonic() - started < 5
+        assert not watcher.drain()
+    finally:
+        watcher.close()
+        os.close(read_fd)
+        os.close(write_fd)
+
+def test_pid_file_lock(pid_config):
+    """Тест определения работающего демона по блокировке PID файла"""
+    assert not is_daemon_running(pid_config)
+
+    pid_fd = acquire_pid_file(pid_config)
+    assert pid_fd is not None
+    try:
+        assert is_daemon_running(pid_config)
+        # Второй экземпляр не может захватить PID файл
+        assert acquire_pid_file(pid_config) is None
+        with open(pid_config.pid_file_path) as f:
+            assert int(f.read()) == os.getpid()
+    finally:
+        os.close(pid_fd)
+
+    # Файл остался, но блокировку никто не держит
+    assert os.path.exists(pid_config.pid_file_path)
+    assert not is_daemon_running(pid_config)
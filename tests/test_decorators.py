@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+import pytest
+from sync_strategies.decorators import retry
+
+def test_retry_backoff(monkeypatch):
+    """Тест экспоненциальной паузы между попытками"""
+    delays = []
+    monkeypatch.setattr('sync_strategies.decorators.time.sleep', delays.append)
+    calls = []
+
+    @retry(max_attempts=4, base_delay=1.0, max_delay=3.0)
+    def flaky():
+        calls.append(1)
+        if len(calls) < 4:
+            raise OSError("temporary failure")
+        return 'done'
+
+    assert flaky() == 'done'
+    assert len(delays) == 3
+    for delay, limit in zip(delays, [1.0, 2.0, 3.0]):
+        assert limit / 2 <= delay <= limit
+
+def test_retry_gives_up(monkeypatch):
+    """Тест: после последней попытки исключение пробрасывается без паузы"""
+    delays = []
+    monkeypatch.setattr('sync_strategies.decorators.time.sleep', delays.append)
+
+    @retry(max_attempts=2)
+    def failing():
+        raise OSError("permanent failure")
+
+    with pytest.raises(OSError):
+        failing()
+    assert len(delays) == 1
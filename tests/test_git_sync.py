@@ -1,82 +1,22 @@
 #!/usr/bin/env python3
 import os
-import tempfile
-import shutil
-import logging
-import time
 import git
 import pytest
+from concurrent.futures import Future
 from config import Config
 from sync_strategies import GitHistorySyncStrategy
+from sync_strategies import git as git_strategy
+from tests.helpers import cmd_of, format_history_entry, parse_history, ts_of
 
-def format_history_entry(command: str, timestamp: int = None) -> str:
-    """Format command into zsh history format"""
-    if timestamp is None:
-        timestamp = int(time.time())
-    return f": {timestamp}:0;{command}\n"
-
-@pytest.fixture
-def setup_git_repo():
-    """Setup test Git repository"""
-    # Create temporary directories
-    remote_dir = tempfile.mkdtemp()
-    work_dir = tempfile.mkdtemp()  # Working directory for initial setup
-    local_repo_dir = tempfile.mkdtemp()
-    local_history_dir = tempfile.mkdtemp()
-    local_history_path = os.path.join(local_history_dir, 'local_history.txt')
-    
-    try:
-        # Initialize bare repository
-        bare_repo = git.Repo.init(remote_dir, bare=True)
-        
-        # Initialize working repository
-        work_repo = git.Repo.init(work_dir)
-        work_repo.create_remote('origin', remote_dir)
-        
-        # Create and commit initial history
-        history_file = os.path.join(work_dir, 'history.txt')
-        with open(history_file, 'w') as f:
-            f.write(format_history_entry("remote_command1", 1000))
-            f.write(format_history_entry("remote_command2", 2000))
-        
-        work_repo.index.add(['history.txt'])
-        work_repo.index.commit("Initial commit")
-        
-        # Create main branch and push to remote
-        work_repo.create_head('main')
-        work_repo.heads.main.checkout()
-        work_repo.git.push('--set-upstream', 'origin', 'main')
-        
-        # Create local history
-        with open(local_history_path, 'w') as f:
-            f.write(format_history_entry("local_command1", 3000))
-            f.write(format_history_entry("local_command2", 4000))
-        
-        # Create config
-        config = Config()
-        config.config = {
-            'sync_type': 'git',
-            'paths': {
-                'local_history': local_history_path,
-                'remote_history': os.path.join(local_repo_dir, 'history.txt'),
-                'git_repo': local_repo_dir,
-                'log_file': os.path.join(local_repo_dir, 'history_syncer.log'),
-                'pid_file': os.path.join(local_repo_dir, 'history_syncer.pid')
-            },
-            'git': {
-                'repository_url': remote_dir,
-                'branch': 'main'
-            }
-        }
-        
-        yield config, remote_dir, local_repo_dir, local_history_path
-        
-    finally:
-        # Cleanup
-        shutil.rmtree(remote_dir, ignore_errors=True)
-        shutil.rmtree(work_dir, ignore_errors=True)
-        shutil.rmtree(local_repo_dir, ignore_errors=True)
-        shutil.rmtree(local_history_dir, ignore_errors=True)
+def push_from_other_machine(remote_dir: str, clone_dir: str, content: str, mode: str = 'a'):
+    """Write history.txt in a separate clone of the remote and push it"""
+    other_repo = git.Repo.clone_from(remote_dir, clone_dir, branch='main', multi_options=['--shared', '--no-tags'])
+    with open(os.path.join(clone_dir, 'history.txt'), mode) as f:
+        f.write(content)
+    other_repo.index.add(['history.txt'])
+    other_repo.index.commit("Other machine")
+    other_repo.git.push('origin', 'main')
+    other_repo.close()
 
 def test_basic_sync(setup_git_repo):
     """Test basic sync functionality"""
@@ -86,8 +26,7 @@ def test_basic_sync(setup_git_repo):
     # Test reading remote history
     remote_history = strategy.read_remote_history()
     assert len(remote_history) == 2
-    assert any("remote_command1" in line for line in remote_history)
-    assert any("remote_command2" in line for line in remote_history)
+    assert set(map(cmd_of, remote_history)) == {"remote_command1", "remote_command2"}
     
     # Test writing new history
     new_command = format_history_entry("new_command", 5000)
@@ -97,9 +36,8 @@ def test_basic_sync(setup_git_repo):
     # Verify updated history
     updated_history = strategy.read_remote_history()
     assert len(updated_history) == 3, f"Expected 3 entries, got {len(updated_history)}: {updated_history}"
-    assert any("remote_command1" in line for line in updated_history), "Missing remote_command1"
-    assert any("remote_command2" in line for line in updated_history), "Missing remote_command2"
-    assert any("new_command" in line for line in updated_history), "Missing new_command"
+    commands = set(map(cmd_of, updated_history))
+    assert commands == {"remote_command1", "remote_command2", "new_command"}, f"Unexpected commands: {commands}"
 
 def test_merge_history(setup_git_repo):
     """Test history merging functionality"""
@@ -113,14 +51,14 @@ def test_merge_history(setup_git_repo):
     
     # Verify merged history
     assert len(merged_history) == 4
-    assert any("remote_command1" in line for line in merged_history)
-    assert any("remote_command2" in line for line in merged_history)
-    assert any("local_command1" in line for line in merged_history)
-    assert any("local_command2" in line for line in merged_history)
+    timestamps, commands = parse_history(merged_history)
+    assert set(commands) >= {"remote_command1", "remote_command2", "local_command1", "local_command2"}
     
     # Verify sorting
-    timestamps = [int(line.split(':')[1].strip()) for line in merged_history]
     assert timestamps == sorted(timestamps)
+    
+    # Entries present on both sides are kept once
+    assert strategy.merge_histories(merged_history, remote_history) == merged_history
 
 def test_clear_history(setup_git_repo):
     """Test history clearing functionality"""
@@ -132,4 +70,191 @@ def test_clear_history(setup_git_repo):
     
     # Verify history is cleared
     history = strategy.read_remote_history()
-    assert len(history) == 0 
\ No newline at end of file
+    assert len(history) == 0
+
+def test_save_history_appends(setup_git_repo):
+    """Test that extending the saved history only appends new lines"""
+    config, _, local_repo_dir, _ = setup_git_repo
+    strategy = GitHistorySyncStrategy(config)
+    history_file = os.path.join(local_repo_dir, 'history.txt')
+    
+    history = [format_history_entry("command1", 1000), format_history_entry("command2", 2000)]
+    strategy.save_history(history)
+    inode = os.stat(history_file).st_ino
+    
+    history.append(format_history_entry("command3", 3000))
+    strategy.save_history(history)
+    assert os.stat(history_file).st_ino == inode
+    with open(history_file, encoding='utf-8') as f:
+        assert f.readlines() == history
+    
+    # A file changed behind our back is rewritten in full
+    with open(history_file, 'w', encoding='utf-8') as f:
+        f.write(format_history_entry("foreign", 500))
+    history.append(format_history_entry("command4", 4000))
+    strategy.save_history(history)
+    with open(history_file, encoding='utf-8') as f:
+        assert f.readlines() == history
+
+def test_existing_repository_is_reused(setup_git_repo):
+    """Test that an existing clone is opened instead of cloned again"""
+    config, _, local_repo_dir, _ = setup_git_repo
+    GitHistorySyncStrategy(config).cleanup()
+    marker = os.path.join(local_repo_dir, '.git', 'marker')
+    open(marker, 'w').close()
+    
+    strategy = GitHistorySyncStrategy(config)
+    assert os.path.exists(marker)
+    assert len(strategy.read_remote_history()) == 2
+
+def test_write_unchanged_history_skips_commit(setup_git_repo, monkeypatch):
+    """Test that writing the history already in HEAD does not stage or commit"""
+    config, _, _, _ = setup_git_repo
+    strategy = GitHistorySyncStrategy(config)
+    remote_history = strategy.read_remote_history()
+    head = strategy.repo.head.commit.hexsha
+    
+    def fail_add(*args, **kwargs):
+        raise AssertionError("index.add must not be called for unchanged history")
+    monkeypatch.setattr(git.IndexFile, 'add', fail_add)
+    strategy.write_remote_history(remote_history)
+    assert strategy.repo.head.commit.hexsha == head
+
+def test_unchanged_remote_skips_fetch(setup_git_repo, monkeypatch):
+    """Test that an unchanged remote branch is not fetched again"""
+    config, _, _, _ = setup_git_repo
+    strategy = GitHistorySyncStrategy(config)
+    strategy.fetch_cache_ttl = 0
+    remote_history = strategy.read_remote_history()
+    
+    def fail_fetch(*args, **kwargs):
+        raise AssertionError("fetch must not be called for an unchanged remote")
+    monkeypatch.setattr(git.Remote, 'fetch', fail_fetch)
+    assert strategy.read_remote_history() == remote_history
+    
+    monkeypatch.undo()
+    strategy.write_remote_history(remote_history + [format_history_entry("new_command", 5000)])
+    assert len(strategy.read_remote_history()) == 3
+
+def test_first_read_uses_background_fetch(setup_git_repo, monkeypatch):
+    """Test that the fetch started during setup serves the first read"""
+    config, _, _, _ = setup_git_repo
+    strategy = GitHistorySyncStrategy(config)
+    
+    def fail_fetch(*args, **kwargs):
+        raise AssertionError("fetch must not run again after the background fetch")
+    monkeypatch.setattr(git.Remote, 'fetch', fail_fetch)
+    assert len(strategy.read_remote_history()) == 2
+
+def test_background_fetch_starts_after_history_file_setup(setup_git_repo, monkeypatch):
+    """Test that the background fetch cannot race the push done by setup_history_file"""
+    config, _, _, _ = setup_git_repo
+    events = []
+    
+    setup_history_file = git_strategy.setup_history_file
+    def record_setup(*args, **kwargs):
+        events.append('setup_history_file')
+        return setup_history_file(*args, **kwargs)
+    monkeypatch.setattr(git_strategy, 'setup_history_file', record_setup)
+    submit = git_strategy.ThreadPoolExecutor.submit
+    def record_submit(self, *args, **kwargs):
+        events.append('fetch')
+        return submit(self, *args, **kwargs)
+    monkeypatch.setattr(git_strategy.ThreadPoolExecutor, 'submit', record_submit)
+    
+    GitHistorySyncStrategy(config).cleanup()
+    assert events == ['setup_history_file', 'fetch']
+
+def test_failed_background_fetch_is_not_raised(setup_git_repo):
+    """Test that any background fetch failure falls back to a regular fetch"""
+    config, _, _, _ = setup_git_repo
+    strategy = GitHistorySyncStrategy(config)
+    strategy._wait_for_prefetch()
+    
+    failed = Future()
+    failed.set_exception(OSError("git executable not found"))
+    strategy._prefetch = failed
+    assert len(strategy.read_remote_history()) == 2
+    
+    strategy._prefetch = failed
+    strategy.cleanup()
+
+def test_first_read_skips_remote_check(setup_git_repo, monkeypatch):
+    """Test that the first read fetches without an ls-remote round trip"""
+    config, _, _, _ = setup_git_repo
+    strategy = GitHistorySyncStrategy(config)
+    
+    def fail_ls_remote(*args, **kwargs):
+        raise AssertionError("remote must not be checked without a cached read")
+    monkeypatch.setattr(GitHistorySyncStrategy, '_remote_head_sha', fail_ls_remote)
+    assert len(strategy.read_remote_history()) == 2
+
+def test_save_history_normalizes_lines(setup_git_repo):
+    """Test that canonical lines are kept and others are normalized or dropped"""
+    config, _, local_repo_dir, _ = setup_git_repo
+    strategy = GitHistorySyncStrategy(config)
+    
+    strategy.save_history([format_history_entry("ls", 1000), ": 2000:7;pwd", "\n", "garbage\n"])
+    with open(os.path.join(local_repo_dir, 'history.txt'), encoding='utf-8') as f:
+        assert f.readlines() == [format_history_entry("ls", 1000), format_history_entry("pwd", 2000)]
+
+def test_repeated_write_skips_push(setup_git_repo, monkeypatch):
+    """Test that writing the same history twice does not commit or push again"""
+    config, _, _, _ = setup_git_repo
+    strategy = GitHistorySyncStrategy(config)
+    history = strategy.read_remote_history() + [format_history_entry("new_command", 5000)]
+    strategy.write_remote_history(history)
+    
+    def fail_commit_and_push(*args, **kwargs):
+        raise AssertionError("an already written history must not be committed again")
+    monkeypatch.setattr(GitHistorySyncStrategy, '_commit_and_push', fail_commit_and_push)
+    strategy.write_remote_history(list(history))
+    
+    # После очистки та же история записывается заново
+    monkeypatch.undo()
+    assert strategy.clear_remote_history()
+    strategy.write_remote_history(history)
+    assert len(strategy.read_remote_history()) == 3
+
+def test_write_after_concurrent_push(setup_git_repo, tmp_path):
+    """Test that a push rejected because of a concurrent push keeps both changes"""
+    config, remote_dir, _, _ = setup_git_repo
+    strategy = GitHistorySyncStrategy(config)
+    history = strategy.read_remote_history()
+    
+    # Another machine pushes after our fetch
+    push_from_other_machine(remote_dir, str(tmp_path / 'other'), format_history_entry("other_command", 4500))
+    
+    strategy.write_remote_history(history + [format_history_entry("new_command", 5000)])
+    
+    remote_history = strategy.read_remote_history()
+    assert list(map(cmd_of, remote_history)) == [
+        "remote_command1", "remote_command2", "other_command", "new_command"
+    ]
+    assert list(map(ts_of, remote_history)) == [1000, 2000, 4500, 5000]
+
+def test_read_remote_history_skips_invalid_lines(setup_git_repo, tmp_path):
+    """Test that lines in other formats are dropped from the remote history"""
+    config, remote_dir, _, _ = setup_git_repo
+    push_from_other_machine(remote_dir, str(tmp_path / 'other'),
+                            format_history_entry("ls", 1000) + "garbage\n\n: 2000:5;pwd", mode='w')
+    
+    strategy = GitHistorySyncStrategy(config)
+    assert strategy.read_remote_history() == [format_history_entry("ls", 1000), ": 2000:5;pwd"]
+
+def test_recent_read_skips_remote_check(setup_git_repo, monkeypatch):
+    """Test that a read within fetch_cache_ttl does not contact the remote"""
+    config, _, _, _ = setup_git_repo
+    config.config['git']['fetch_cache_ttl'] = 60
+    strategy = GitHistorySyncStrategy(config)
+    remote_history = strategy.read_remote_history()
+    
+    def fail_ls_remote(*args, **kwargs):
+        raise AssertionError("remote must not be checked within fetch_cache_ttl")
+    monkeypatch.setattr(GitHistorySyncStrategy, '_remote_head_sha', fail_ls_remote)
+    assert strategy.read_remote_history() == remote_history
+    
+    # A push makes the cached history stale
+    monkeypatch.undo()
+    strategy.write_remote_history(remote_history + [format_history_entry("new_command", 5000)])
+    assert len(strategy.read_remote_history()) == 3
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+import logging
+import pytest
+from config import Config
+from history_syncer import setup_logging
+
+@pytest.fixture
+def log_config(tmp_path):
+    """Фикстура конфигурации с файлом логов во временной директории"""
+    config = Config()
+    config.config = {'paths': {'log_file': str(tmp_path / 'logs' / 'history_syncer.log')}}
+    root_logger = logging.getLogger()
+    saved_handlers, saved_level = list(root_logger.handlers), root_logger.level
+    yield config
+    # setup_logging заменяет обработчики корневого логгера, возвращаем прежние
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+        handler.close()
+    for handler in saved_handlers:
+        root_logger.addHandler(handler)
+    root_logger.setLevel(saved_level)
+
+def test_warning_flushes_log_buffer(log_config):
+    """Тест: предупреждение сразу записывает накопленные сообщения в файл"""
+    setup_logging(log_config)
+    logging.getLogger('test').info("buffered message")
+    logging.getLogger('test').warning("warning message")
+
+    with open(log_config.log_file_path, encoding='utf-8') as f:
+        content = f.read()
+    assert "buffered message" in content and "warning message" in content
@@ -1,43 +1,36 @@
 #!/usr/bin/env python3
-import os
-import tempfile
-import logging
-import time
+import pytest
 from config import Config
 from sync_strategies import MemoryHistorySyncStrategy
+from tests.helpers import format_history_entry
 
-def format_history_entry(command: str) -> str:
-    """Форматирует команду в формат zsh истории"""
-    timestamp = int(time.time())
-    return f": {timestamp}:0;{command}\n"
-
-def test_memory_syncer():
-    """Тест синхронизации в памяти"""
+@pytest.fixture
+def memory_strategy():
+    """Фикстура для стратегии в памяти: файлы ей не нужны"""
     config = Config()
-    config.config = {
-        'sync_type': 'memory',
-        'paths': {
-            'local_history': '/tmp/test_history',
-            'remote_history': '/tmp/test_remote_history',
-            'log_file': '/tmp/test.log',
-            'pid_file': '/tmp/test.pid'
-        }
-    }
-    strategy = MemoryHistorySyncStrategy(config)
-    
-    # Тест записи и чтения
-    test_history = ['command1', 'command2']
-    strategy.write_remote_history(test_history)
-    assert strategy.read_remote_history() == test_history
-    
-    # Тест добавления новых команд
-    new_history = ['command1', 'command2', 'command3']
-    strategy.write_remote_history(new_history)
-    assert strategy.read_remote_history() == new_history
-    
-    # Тест очистки
-    strategy.clear_remote_history()
-    assert strategy.read_remote_history() == []
+    config.config = {'sync_type': 'memory', 'paths': {}}
+    return MemoryHistorySyncStrategy(config)
+
+@pytest.mark.parametrize("commands", [
+    pytest.param(["command1", "command2"], id="basic"),
+    pytest.param(["command1", "command2", "command3"], id="append"),
+    pytest.param([], id="empty"),
+])
+def test_write_and_read(memory_strategy, commands):
+    """Тест записи и чтения истории"""
+    history = [format_history_entry(command, 1000 + i) for i, command in enumerate(commands)]
+    memory_strategy.write_remote_history(history)
+    assert memory_strategy.read_remote_history() == history
+
+def test_overwrite_and_clear(memory_strategy):
+    """Тест: новая запись заменяет историю, очистка удаляет ее"""
+    memory_strategy.write_remote_history([format_history_entry("command1", 1000)])
+    new_history = [format_history_entry("command1", 1000), format_history_entry("command2", 1001)]
+    memory_strategy.write_remote_history(new_history)
+    assert memory_strategy.read_remote_history() == new_history
+
+    memory_strategy.clear_remote_history()
+    assert memory_strategy.read_remote_history() == []
 
 if __name__ == '__main__':
-    test_memory_syncer() 
\ No newline at end of file
+    pytest.main([__file__])
@@ -1,36 +1,45 @@
 #!/usr/bin/env python3
 import os
-import tempfile
-import shutil
-import logging
 import time
 import unittest
-from unittest.mock import MagicMock, patch
+import collections
 from config import Config
 from sync_strategies import SSHHistorySyncStrategy
+from sync_strategies.ssh import CONTROL_PERSIST
 import subprocess
 import pytest
+from tests.helpers import cmd_of, format_history_entry, format_history_entry_bytes
 
-def format_history_entry(command: str, timestamp: int = None) -> str:
-    """Форматирует команду в формат zsh истории"""
-    if timestamp is None:
-        timestamp = int(time.time())
-    return f": {timestamp}:0;{command}\n"
+FakeResult = collections.namedtuple('FakeResult', 'returncode stdout stderr')
+
+class FakeRun:
+    """Замена subprocess.run: запоминает вызовы и возвращает заданный результат"""
+
+    def __init__(self):
+        self.result = FakeResult(0, '', '')
+        self.calls = []
+
+    def __call__(self, cmd, *args, **kwargs):
+        self.calls.append((cmd, kwargs))
+        if isinstance(self.result, BaseException):
+            raise self.result
+        return self.result
 
 @pytest.fixture
-def ssh_config():
+def ssh_config(tmp_path):
     """Фикстура для конфигурации SSH"""
     config = Config()
     config.config = {
         'paths': {
-            'local_history': '/tmp/local_history.txt',
-            'remote_history': '/tmp/remote_history.txt',
-            'pid_file': '/tmp/pid',
-            'lock_file': '/tmp/lock'
+            'local_history': str(tmp_path / 'local_history.txt'),
+            'remote_history': str(tmp_path / 'remote_history.txt'),
+            'pid_file': str(tmp_path / 'pid'),
+            'lock_file': str(tmp_path / 'lock')
         },
         'ssh': {
             'username': 'test',
-            'host': 'test.com'
+            'host': 'test.com',
+            'control_path': str(tmp_path / 'ssh' / 'zsh_sync-%C')
         }
     }
     return config
@@ -40,54 +49,105 @@ def ssh_strategy(ssh_config):
     """Фикстура для SSH стратегии"""
     return SSHHistorySyncStrategy(ssh_config)
 
-def test_read_remote_history(ssh_strategy, mocker):
+@pytest.fixture
+def fake_run(monkeypatch):
+    """Фикстура, подменяющая subprocess.run"""
+    run = FakeRun()
+    monkeypatch.setattr(subprocess, 'run', run)
+    return run
+
+def test_read_remote_history(ssh_strategy, fake_run):
     """Тест чтения удаленной истории"""
-    # Настраиваем мок для чтения удаленного файла
-    remote_content = format_history_entry('remote_command_1') + format_history_entry('remote_command_2')
-    mock_run = mocker.patch('subprocess.run')
-    mock_run.return_value = MagicMock(
-        returncode=0,
-        stdout=remote_content,
-        text=True
-    )
+    # Настраиваем подмену для чтения удаленного файла
+    remote_content = format_history_entry('remote_command_1', 1000) + format_history_entry('remote_command_2', 1001)
+    fake_run.result = FakeResult(0, remote_content, '')
 
     # Читаем удаленную историю
     history = ssh_strategy.read_remote_history()
 
     # Проверяем результат
     assert len(history) == 2
-    assert any('remote_command_1' in line for line in history)
-    assert any('remote_command_2' in line for line in history)
+    assert set(map(cmd_of, history)) == {'remote_command_1', 'remote_command_2'}
 
-def test_write_remote_history(ssh_strategy, mocker):
+def test_write_remote_history(ssh_strategy, fake_run):
     """Тест записи удаленной истории"""
     # Подготавливаем историю для записи
-    history = [
-        format_history_entry('command_1'),
-        format_history_entry('command_2')
-    ]
-
-    # Настраиваем мок для записи файла
-    mock_run = mocker.patch('subprocess.run')
-    mock_run.return_value = MagicMock(returncode=0)
+    commands = ['command_1', 'command_2']
+    history = [format_history_entry(command, 1000 + i) for i, command in enumerate(commands)]
+    payload = b''.join(format_history_entry_bytes(command, 1000 + i) for i, command in enumerate(commands))
 
     # Записываем историю
     ssh_strategy.write_remote_history(history)
 
-    # Проверяем, что команды были вызваны
-    assert mock_run.call_count == 2  # mkdir и scp
-    assert 'mkdir' in mock_run.call_args_list[0][0][0][-1]  # Первый вызов - создание директории
-    assert 'scp' in mock_run.call_args_list[1][0][0][0]  # Второй вызов - копирование файла
-
-def test_invalid_history_format(ssh_strategy, mocker):
+    # Проверяем, что история передана одной командой ssh
+    assert len(fake_run.calls) == 1
+    command, kwargs = fake_run.calls[0]
+    assert command[0] == 'ssh'
+    assert 'mkdir -p' in command[-1] and 'cat >' in command[-1]
+    assert kwargs['input'] == payload
+
+def test_repeated_writes_reuse_connection(ssh_strategy, fake_run):
+    """Тест: каждая запись - один вызов ssh через общий мультиплексированный сокет"""
+    ssh_strategy.write_remote_history([format_history_entry('command_1', 1000)])
+    ssh_strategy.write_remote_history([format_history_entry('command_2', 1001)])
+
+    assert len(fake_run.calls) == 2
+    for command, _ in fake_run.calls:
+        assert 'ControlMaster=auto' in command
+        assert f'ControlPersist={CONTROL_PERSIST}' in command
+        assert f'ControlPath={ssh_strategy.control_path}' in command
+        assert command[-2] == ssh_strategy.ssh_connection
+    assert fake_run.calls[0][0][:-1] == fake_run.calls[1][0][:-1]
+
+def test_ssh_commands_share_connection(ssh_strategy, fake_run):
+    """Тест: все вызовы ssh и scp используют общее соединение"""
+    ssh_strategy.read_remote_history()
+    ssh_strategy.write_remote_history([format_history_entry('command_1', 1000)])
+    ssh_strategy.cleanup()
+
+    control_path = f'ControlPath={ssh_strategy.control_path}'
+    for command, _ in fake_run.calls:
+        assert control_path in command
+        assert '-O' not in command
+
+    # Общее соединение закрывается только при остановке демона
+    ssh_strategy.close()
+    assert '-O' in fake_run.calls[-1][0]
+
+def test_close_without_connection(ssh_strategy, fake_run):
+    """Тест: close без единого вызова ssh ничего не запускает"""
+    ssh_strategy.close()
+    assert fake_run.calls == []
+
+def test_control_dir_created_on_first_connect(ssh_strategy, fake_run, tmp_path):
+    """Тест: каталог сокета создается при первом вызове ssh, а не в конструкторе"""
+    assert not (tmp_path / 'ssh').exists()
+    ssh_strategy.read_remote_history()
+    assert (tmp_path / 'ssh').is_dir()
+
+def test_clear_remote_history(ssh_strategy, fake_run):
+    """Тест очистки удаленной истории одним вызовом ssh"""
+    assert ssh_strategy.clear_remote_history()
+    assert len(fake_run.calls) == 1
+
+    # Код 2 - файл блокировки уже существует
+    fake_run.result = FakeResult(2, '', '')
+    assert not ssh_strategy.clear_remote_history()
+
+def test_wait_for_lock_backoff(ssh_strategy, monkeypatch):
+    """Тест: паузы между проверками блокировки растут и не выходят за таймаут"""
+    lock_states = iter([True, True, True, False])
+    monkeypatch.setattr(ssh_strategy, '_check_lock_file', lambda: next(lock_states))
+    delays = []
+    monkeypatch.setattr(time, 'sleep', delays.append)
+
+    assert ssh_strategy._wait_for_lock_with_timeout(timeout=5)
+    assert delays == sorted(delays) and len(delays) == 3 and delays[0] < delays[-1]
+
+def test_invalid_history_format(ssh_strategy, fake_run):
     """Тест обработки некорректного формата истории"""
-    # Настраиваем мок для чтения файла с некорректным форматом
-    mock_run = mocker.patch('subprocess.run')
-    mock_run.return_value = MagicMock(
-        returncode=0,
-        stdout='invalid format',
-        text=True
-    )
+    # Настраиваем подмену для чтения файла с некорректным форматом
+    fake_run.result = FakeResult(0, 'invalid format', '')
 
     # Читаем удаленную историю
     history = ssh_strategy.read_remote_history()
@@ -96,10 +156,9 @@ def test_invalid_history_format(ssh_strategy, mocker):
     assert len(history) == 1
     assert 'invalid format' in history[0]
 
-def test_file_permission_error(ssh_strategy, mocker):
+def test_file_permission_error(ssh_strategy, fake_run):
     """Тест обработки ошибки доступа к файлу"""
-    mock_run = mocker.patch('subprocess.run')
-    mock_run.side_effect = subprocess.CalledProcessError(
+    fake_run.result = subprocess.CalledProcessError(
         returncode=1,
         cmd=['ssh'],
         stderr='Permission denied'
@@ -108,10 +167,9 @@ def test_file_permission_error(ssh_strategy, mocker):
     with pytest.raises(subprocess.CalledProcessError):
         ssh_strategy.read_remote_history()
 
-def test_network_timeout(ssh_strategy, mocker):
+def test_network_timeout(ssh_strategy, fake_run):
     """Тест обработки таймаута сети"""
-    mock_run = mocker.patch('subprocess.run')
-    mock_run.side_effect = subprocess.TimeoutExpired(
+    fake_run.result = subprocess.TimeoutExpired(
         cmd=['ssh'],
         timeout=10
     )
@@ -119,10 +177,9 @@ def test_network_timeout(ssh_strategy, mocker):
     with pytest.raises(subprocess.TimeoutExpired):
         ssh_strategy.read_remote_history()
 
-def test_ssh_connection_failure(ssh_strategy, mocker):
+def test_ssh_connection_failure(ssh_strategy, fake_run):
     """Тест обработки ошибки подключения SSH"""
-    mock_run = mocker.patch('subprocess.run')
-    mock_run.side_effect = subprocess.CalledProcessError(
+    fake_run.result = subprocess.CalledProcessError(
         returncode=255,
         cmd=['ssh'],
         stderr='Connection refused'
@@ -131,5 +188,60 @@ def test_ssh_connection_failure(ssh_strategy, mocker):
     with pytest.raises(subprocess.CalledProcessError):
         ssh_strategy.read_remote_history()
 
+def test_merge_histories(ssh_strategy):
+    """Тест объединения историй по времени с удалением дубликатов"""
+    current_history = [
+        format_history_entry('command_2', 2000),
+        format_history_entry('command_10', 10000)
+    ]
+    remote_history = [
+        format_history_entry('command_1', 1000).rstrip('\n'),
+        format_history_entry('command_2', 2000).rstrip('\n')
+    ]
+
+    merged = ssh_strategy.merge_histories(current_history, remote_history)
+
+    assert merged == [
+        format_history_entry('command_1', 1000),
+        format_history_entry('command_2', 2000),
+        format_history_entry('command_10', 10000)
+    ]
+
+def test_merge_histories_dedupes_remote(ssh_strategy):
+    """Тест: повторы внутри удаленной истории тоже удаляются"""
+    remote_history = [
+        format_history_entry('command_1', 1000).rstrip('\n'),
+        format_history_entry('command_1', 1000),
+        format_history_entry('command_2', 2000).rstrip('\n')
+    ]
+
+    merged = ssh_strategy.merge_histories([format_history_entry('command_2', 2000)], remote_history)
+
+    assert merged == [format_history_entry('command_1', 1000), format_history_entry('command_2', 2000)]
+
+def test_read_file_with_fallback(ssh_strategy, tmp_path):
+    """Тест чтения файла в UTF-8 и с откатом на другую кодировку"""
+    path = tmp_path / 'history'
+    path.write_bytes(': 1000:0;echo привет\n: 2000:0;ls'.encode('utf-8'))
+    assert ssh_strategy._read_file_with_fallback(str(path)) == [': 1000:0;echo привет\n', ': 2000:0;ls']
+
+    path.write_bytes(b': 1000:0;echo \xff\n')
+    assert ssh_strategy._read_file_with_fallback(str(path)) == [': 1000:0;echo \xff\n']
+
+def test_write_file_safely(ssh_strategy, tmp_path):
+    """Тест: прочитанные строки записываются обратно без изменений"""
+    raw_content = ': 1000:0;echo ok\n: 2000:0;ls файл\n'.encode('utf-8')
+    source_path = tmp_path / 'history'
+    source_path.write_bytes(raw_content)
+
+    target_path = tmp_path / 'copy'
+    ssh_strategy._write_file_safely(str(target_path), ssh_strategy._read_file_with_fallback(str(source_path)))
+
+    assert target_path.read_bytes() == raw_content
+    assert sorted(os.listdir(tmp_path)) == ['copy', 'history']
+
+    ssh_strategy._write_file_safely(str(target_path), [': 3000:0;echo \udcff\n', b': 4000:0;ls\n'])
+    assert target_path.read_bytes() == b': 3000:0;echo \xff\n: 4000:0;ls\n'
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
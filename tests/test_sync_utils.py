@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+import os
+from config import Config
+from actions import sync_utils
+from sync_strategies import MemoryHistorySyncStrategy
+from actions.sync_utils import (
+    parse_history,
+    merge_histories,
+    read_local_history,
+    write_local_history,
+    sync_history
+)
+from tests.helpers import format_history_entry
+
+def test_parse_history():
+    """Тест разбора истории с пропуском строк другого формата"""
+    text = (
+        format_history_entry('git status', 1000)
+        + 'invalid line\n'
+        + ': 2000:5;echo a:b;c\n'
+        + ': abc:0;bad timestamp\n'
+        + ': 3000;no duration\n'
+    )
+    assert parse_history(text) == [
+        (1000, 'git status'),
+        (2000, 'echo a:b;c'),
+        (3000, 'no duration')
+    ]
+
+def test_merge_histories():
+    """Тест объединения историй с удалением дубликатов и сортировкой"""
+    local_history = [
+        format_history_entry('local_command', 3000),
+        format_history_entry('shared_command', 2000)
+    ]
+    # Строки без перевода строки, как их возвращает SSH стратегия
+    remote_history = [
+        format_history_entry('remote_command', 1000).rstrip('\n'),
+        format_history_entry('shared_command', 2000).rstrip('\n')
+    ]
+
+    merged_history = merge_histories(local_history, remote_history)
+
+    assert merged_history == [
+        format_history_entry('remote_command', 1000),
+        format_history_entry('shared_command', 2000),
+        format_history_entry('local_command', 3000)
+    ]
+
+def test_merge_histories_same_timestamp():
+    """Тест: дубликаты удаляются и среди нескольких команд с одной меткой времени"""
+    history = [
+        format_history_entry('command1', 1000),
+        format_history_entry('command2', 1000),
+        format_history_entry('command3', 2000)
+    ]
+
+    assert merge_histories(history, list(history)) == history
+
+def test_read_local_history(tmp_path):
+    """Тест чтения и нормализации локальной истории"""
+    history_path = os.path.join(tmp_path, 'history')
+    with open(history_path, 'w', encoding='utf-8') as f:
+        f.write(': 1000:7;ls\n')
+        f.write('\n')
+        f.write(format_history_entry('echo привет', 2000))
+
+    assert read_local_history(history_path) == [
+        format_history_entry('ls', 1000),
+        format_history_entry('echo привет', 2000)
+    ]
+
+def test_read_local_history_invalid_utf8(tmp_path):
+    """Тест: байт не в UTF-8 не приводит к потере локальной истории"""
+    history_path = os.path.join(tmp_path, 'history')
+    with open(history_path, 'wb') as f:
+        f.write(b': 1000:0;echo \xff\n: 2000:0;ls\n')
+
+    assert read_local_history(history_path) == [
+        format_history_entry('echo \ufffd', 1000),
+        format_history_entry('ls', 2000)
+    ]
+
+def test_read_missing_local_history(tmp_path):
+    """Тест чтения несуществующего файла истории"""
+    assert read_local_history(os.path.join(tmp_path, 'missing')) == []
+
+def test_read_empty_local_history(tmp_path):
+    """Тест чтения пустого файла истории"""
+    history_path = os.path.join(tmp_path, 'history')
+    open(history_path, 'w').close()
+    assert read_local_history(history_path) == []
+
+def test_write_local_history(tmp_path):
+    """Тест записи истории, превышающей лимит буферов одного writev"""
+    history_path = os.path.join(tmp_path, 'history')
+    history = [format_history_entry(f'command{i}', 1000 + i) for i in range(5000)]
+
+    write_local_history(history_path, history)
+
+    with open(history_path, 'r', encoding='utf-8') as f:
+        assert f.read() == ''.join(history)
+    assert read_local_history(history_path) == history
+
+def test_read_local_history_cache(tmp_path, monkeypatch):
+    """Тест: неизмененный файл истории не разбирается повторно"""
+    history_path = os.path.join(tmp_path, 'history')
+    history = [format_history_entry('ls', 1000)]
+    write_local_history(history_path, history)
+    assert read_local_history(history_path) == history
+
+    monkeypatch.setattr(sync_utils, 'parse_history_bytes', None)
+    assert read_local_history(history_path) == history
+    monkeypatch.undo()
+
+    with open(history_path, 'a', encoding='utf-8') as f:
+        f.write(format_history_entry('pwd', 2000))
+    assert read_local_history(history_path) == history + [format_history_entry('pwd', 2000)]
+
+class AppendingMemoryStrategy(MemoryHistorySyncStrategy):
+    """Стратегия, имитирующая zsh, дописывающий команду во время синхронизации"""
+
+    def __init__(self, config: Config, local_history_path: str, entry: str):
+        super().__init__(config)
+        self.local_history_path = local_history_path
+        self.entry = entry
+
+    def write_remote_history(self, new_history: list):
+        super().write_remote_history(new_history)
+        with open(self.local_history_path, 'a', encoding='utf-8') as f:
+            f.write(self.entry)
+
+def test_sync_history_keeps_appended_entries(tmp_path):
+    """Тест: команды, добавленные во время синхронизации, не теряются"""
+    local_history_path = os.path.join(tmp_path, 'history')
+    with open(local_history_path, 'w', encoding='utf-8') as f:
+        f.write(format_history_entry('local_command', 2000))
+
+    config = Config()
+    config.config = {'paths': {
+        'local_history': local_history_path,
+        'state_file': os.path.join(tmp_path, 'state.json')
+    }}
+    appended_entry = format_history_entry('typed_during_sync', 3000)
+    strategy = AppendingMemoryStrategy(config, local_history_path, appended_entry)
+    strategy.history = [format_history_entry('remote_command', 1000)]
+
+    sync_history(config, strategy)
+
+    assert read_local_history(local_history_path) == [
+        format_history_entry('remote_command', 1000),
+        format_history_entry('local_command', 2000),
+        appended_entry
+    ]
+
+def test_sync_history_pushes_appended_entries(tmp_path):
+    """Тест: команды, добавленные во время синхронизации, отправляются в следующем цикле"""
+    local_history_path = os.path.join(tmp_path, 'history')
+    with open(local_history_path, 'w', encoding='utf-8') as f:
+        f.write(format_history_entry('local_command', 2000))
+
+    config = Config()
+    config.config = {'paths': {
+        'local_history': local_history_path,
+        'state_file': os.path.join(tmp_path, 'state.json')
+    }}
+    appended_entry = format_history_entry('typed_during_sync', 3000)
+    strategy = AppendingMemoryStrategy(config, local_history_path, appended_entry)
+    strategy.history = [format_history_entry('remote_command', 1000)]
+
+    sync_history(config, strategy)
+    assert appended_entry not in strategy.read_remote_history()
+
+    sync_history(config, strategy)
+    assert strategy.read_remote_history() == [
+        format_history_entry('remote_command', 1000),
+        format_history_entry('local_command', 2000),
+        appended_entry
+    ]
+
+class CountingMemoryStrategy(MemoryHistorySyncStrategy):
+    """Стратегия, считающая записи удаленной истории"""
+
+    def __init__(self, config: Config):
+        super().__init__(config)
+        self.writes = 0
+
+    def write_remote_history(self, new_history: list):
+        super().write_remote_history(new_history)
+        self.writes += 1
+
+def test_sync_history_skips_unchanged(tmp_path):
+    """Тест: без изменений в историях повторная синхронизация пропускается"""
+    local_history_path = os.path.join(tmp_path, 'history')
+    with open(local_history_path, 'w', encoding='utf-8') as f:
+        f.write(format_history_entry('local_command', 2000))
+
+    config = Config()
+    config.config = {'paths': {
+        'local_history': local_history_path,
+        'state_file': os.path.join(tmp_path, 'state.json')
+    }}
+    strategy = CountingMemoryStrategy(config)
+    strategy.history = [format_history_entry('remote_command', 1000)]
+
+    sync_history(config, strategy)
+    sync_history(config, strategy)
+    assert strategy.writes == 1
+
+    # Новая команда в локальной истории снова запускает объединение
+    with open(local_history_path, 'a', encoding='utf-8') as f:
+        f.write(format_history_entry('new_command', 3000))
+    sync_history(config, strategy)
+    assert strategy.writes == 2
+    assert strategy.history[-1] == format_history_entry('new_command', 3000)
+
+def test_merge_unsorted_histories():
+    """Тест объединения историй, нарушающих порядок timestamp"""
+    local_history = [
+        format_history_entry('command3', 3000),
+        format_history_entry('command1', 1000)
+    ]
+    remote_history = [
+        format_history_entry('command4', 4000),
+        format_history_entry('command2', 2000),
+        format_history_entry('command1', 1000)
+    ]
+
+    merged_history = merge_histories(local_history, remote_history)
+
+    assert merged_history == [
+        format_history_entry(f'command{i}', i * 1000) for i in range(1, 5)
+    ]